@@ -1,223 +1,338 @@
 import tkinter as tk
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-import yt_dlp
 import os
 import threading
-from PIL import Image, ImageTk
-import requests
-from io import BytesIO
 import time
+from io import BytesIO
 import logging
 import queue
 import sys
 import subprocess
-import shutil
 import re
-from contextlib import contextmanager
-
-# --- Path and Environment Setup ---
-def get_ffmpeg_path():
-    """ Find the path to ffmpeg executable. """
-    if getattr(sys, 'frozen', False):
-        base_path = sys._MEIPASS
-        ffmpeg_path = os.path.join(base_path, 'ffmpeg.exe')
-        if os.path.exists(ffmpeg_path):
-            return ffmpeg_path
-    # Fallback to system ffmpeg
-    ffmpeg_path = shutil.which('ffmpeg')
-    if ffmpeg_path:
-        return ffmpeg_path
-    # Additional paths to check
-    possible_paths = [
-        '/usr/local/bin/ffmpeg',
-        '/usr/bin/ffmpeg',
-        os.path.join(os.path.expanduser('~'), 'ffmpeg', 'bin', 'ffmpeg.exe')
-    ]
-    for path in possible_paths:
-        if os.path.exists(path):
-            return path
-    return None
-
-FFMPEG_PATH = get_ffmpeg_path()
-if FFMPEG_PATH:
-    ffmpeg_dir = os.path.dirname(FFMPEG_PATH)
-    if ffmpeg_dir not in os.environ['PATH']:
-        os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ['PATH']
-
-# Configure logging
-logging.basicConfig(filename='debug.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from y2engine import (
+    APP_DATA_DIR, DEFAULT_DOWNLOAD_FOLDER, THUMBNAIL_TIMEOUT, USER_AGENT,
+    CancelToken, DownloadJob, PlaylistExpansion, WakeupQueue, active_downloads, aggregate_stats, bandwidth_governor, download_queue,
+    download_scheduler, fetch_video_details, format_duration, get_ffmpeg_location,
+    job_journal, metadata_prefetcher, metrics, parse_rate, parse_url_list, setup_logging, start_metrics_server, start_stats_file_writer, warm_up,
+)
 
 # --- Configuration ---
-DEFAULT_DOWNLOAD_FOLDER = os.path.expanduser("~/Downloads")
-USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36'
-
-# --- Global Variables ---
-download_queue = queue.Queue()
-details_queue = queue.Queue()
-active_downloads = {}
-
-# --- Timeout Context Manager (Unix-only) ---
-@contextmanager
-def timeout(seconds):
-    """ Context manager for setting a timeout (Unix only). """
-    if sys.platform != "win32":
-        import signal
-        def handler(signum, frame):
-            raise TimeoutError("Operation timed out")
-        signal.signal(signal.SIGALRM, handler)
-        signal.alarm(seconds)
+THUMBNAIL_CACHE_DIR = os.path.join(APP_DATA_DIR, "thumbnails")
+THUMBNAIL_SIZE = (160, 90)
+ROW_THUMBNAIL_SIZE = (80, 45)
+MAX_PLAYLIST_BATCHES_PER_FRAME = 2
+MAX_UI_UPDATES_PER_FRAME = 100
+MIN_FRAME_INTERVAL = 0.02  # events arriving faster than this are batched into one frame
+FALLBACK_POLL_INTERVAL = 50  # ms; only used when Tcl is built without thread support
+MAX_CONCURRENT_DOWNLOADS_CHOICES = ["1", "2", "3", "4", "6", "8"]
+STATS_REFRESH_INTERVAL = 0.5
+SPEED_LIMIT_CHOICES = ["Unlimited", "512K", "1M", "2M", "5M", "10M", "20M"]
+SEGMENT_CHOICES = ["1", "2", "4", "8"]
+
+# --- Thumbnail Pipeline ---
+def thumbnail_url_for(info_dict):
+    """ Pick a thumbnail URL from a full or flat (playlist entry) info dict. """
+    if info_dict.get('thumbnail'):
+        return info_dict['thumbnail']
+    thumbnails = info_dict.get('thumbnails') or []
+    return thumbnails[-1].get('url') if thumbnails else None
+
+class ThumbnailLoader:
+    """ Fetches, decodes and resizes thumbnails off the Tk thread.
+
+    Downloads share one pooled requests.Session. Resized images are kept in an
+    in-memory LRU and written to THUMBNAIL_CACHE_DIR, both keyed by URL, so the
+    main thread only ever receives a ready-to-display PIL image. PIL and
+    requests are only imported once the first thumbnail is needed.
+    """
+    def __init__(self, cache_dir=THUMBNAIL_CACHE_DIR, size=THUMBNAIL_SIZE, max_memory_items=256, workers=4):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_memory_items = max_memory_items
+        self.workers = workers
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    def _disk_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.jpg')
+
+    def _remember(self, url, img):
+        with self._lock:
+            self._memory[url] = img
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, url, token=None):
+        """ Return the resized thumbnail for url, or None if it cannot be loaded in time. Blocking. """
+        if not url:
+            return None
+        token = token or CancelToken(THUMBNAIL_TIMEOUT)
+        from PIL import Image
+        with self._lock:
+            img = self._memory.get(url)
+            if img is not None:
+                self._memory.move_to_end(url)
+                return img
+        disk_path = self._disk_path(url)
+        try:
+            if os.path.exists(disk_path):
+                img = Image.open(disk_path)
+                img.load()
+                self._remember(url, img)
+                return img
+        except Exception as e:
+            logging.warning(f"Discarding unreadable cached thumbnail {disk_path}: {e}")
+        started = time.monotonic()
         try:
-            yield
+            # The read timeout applies per chunk, so the token bounds the whole transfer.
+            with self.session.get(url, timeout=min(10, token.remaining() or 10), stream=True) as response:
+                response.raise_for_status()
+                content = BytesIO()
+                for chunk in response.iter_content(64 * 1024):
+                    token.raise_if_cancelled()
+                    content.write(chunk)
+            content.seek(0)
+            img = Image.open(content)
+            img = img.convert('RGB')
+            img.thumbnail(self.size, Image.Resampling.LANCZOS)
+        except Exception as e:
+            metrics.inc('y2_errors_total', phase='thumbnail', error_class=type(e).__name__)
+            logging.error(f"Failed to load thumbnail {url}: {e}")
+            return None
         finally:
-            signal.alarm(0)
-    else:
-        yield  # No timeout support on Windows
-
-class DownloadTask:
-    def __init__(self, master, url, folder, quality_format, is_playlist, info_dict):
-        self.master = master
-        self.url = url
-        self.folder = folder
-        self.quality_format = quality_format
-        self.is_playlist = is_playlist
-        self.info_dict = info_dict
-        self.cancel_flag = False
-        self.start_time = None
-        self.task_id = id(self)
-        self.filepath = None
-
-        self._create_ui()
-        self.start_download()
-
-    def _create_ui(self):
-        self.frame = ctk.CTkFrame(self.master, corner_radius=10)
-        self.frame.pack(fill="x", pady=10, padx=5)
-
-        title = self.info_dict.get('title', 'Unknown Title')
-        self.title_label = ctk.CTkLabel(self.frame, text=title, font=("Roboto", 14, "bold"), wraplength=550, justify="left")
-        self.title_label.pack(side="top", padx=10, pady=(10, 5), anchor="w")
-
-        self.main_progress_label = ctk.CTkLabel(self.frame, text="Download Progress: 0.00%", font=("Roboto", 12))
-        self.main_progress_label.pack(side="top", padx=10, pady=2, anchor="w")
-
-        self.size_progress_label = ctk.CTkLabel(self.frame, text="Downloaded: 0.00 MB / 0.00 MB", font=("Roboto", 12))
-        self.size_progress_label.pack(side="top", padx=10, pady=2, anchor="w")
-
-        self.time_label = ctk.CTkLabel(self.frame, text="Elapsed Time: 0.00 seconds", font=("Roboto", 12))
-        self.time_label.pack(side="top", padx=10, pady=2, anchor="w")
-
-        self.progress_bar = ctk.CTkProgressBar(self.frame, height=10, corner_radius=5)
-        self.progress_bar.set(0)
-        self.progress_bar.pack(fill="x", padx=10, pady=10, expand=True)
-
-        self.status_label = ctk.CTkLabel(self.frame, text="Starting...", font=("Roboto", 12, "italic"))
-        self.status_label.pack(side="top", padx=10, pady=5, anchor="w")
+            metrics.observe('y2_phase_seconds', time.monotonic() - started, phase='thumbnail')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            img.save(disk_path, 'JPEG', quality=90)
+        except OSError as e:
+            logging.warning(f"Could not cache thumbnail {url}: {e}")
+        self._remember(url, img)
+        return img
+
+    def submit(self, url, callback):
+        """ Load url in the background and call callback(img) from the worker thread. """
+        future = self._executor.submit(self.get, url)
+        future.add_done_callback(lambda f: callback(f.result()))
+
+thumbnail_loader = ThumbnailLoader()
+
+def quality_options_for(info_dict):
+    """ (format_id, label) choices offered for a loaded video. """
+    quality_options = []
+    for f in info_dict.get('formats', []):
+        if f.get('vcodec') != 'none' and f.get('acodec') != 'none':
+            resolution = f.get('height', 'Unknown') if f.get('height') else 'Unknown Resolution'
+            ext = f.get('ext', 'mp4')
+            filesize = f.get('filesize') or f.get('filesize_approx')
+            size_mb = f"{filesize / (1024*1024):.2f} MB" if filesize else "Unknown size"
+            quality_options.append((f['format_id'], f"Video: {resolution}p ({ext}) - {size_mb}"))
+        elif f.get('vcodec') == 'none' and f.get('acodec') != 'none':
+            ext = f.get('ext', 'mp3')
+            filesize = f.get('filesize') or f.get('filesize_approx')
+            size_mb = f"{filesize / (1024*1024):.2f} MB" if filesize else "Unknown size"
+            quality_options.append((f['format_id'], f"Audio: {ext.upper()} - {size_mb}"))
+    quality_options.append(('bestaudio/best', "Audio only (mp3) - Best Quality"))
+    return quality_options
 
-        self.actions_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
-        self.actions_frame.pack(fill="x", padx=10, pady=5)
+# --- Global Variables ---
+details_queue = WakeupQueue()
+expansion_queue = WakeupQueue()
+
+# --- UI Wakeups ---
+class TkWakeup:
+    """ Lets worker threads wake the Tk loop instead of it polling on a timer.
+
+    notify() may be called from any thread. The first call since callback
+    last ran posts a virtual event to the Tk event queue; further calls are
+    absorbed until then, so a burst costs one wakeup. With a Tcl built
+    without thread support, event_generate from another thread is unsafe,
+    so callback is polled every FALLBACK_POLL_INTERVAL ms instead.
+
+    Posting fails while the main loop is not running (before mainloop() or
+    during teardown). Producers such as ProgressChannel only notify on the
+    empty to non-empty transition, so a wakeup lost before the loop starts
+    stays pending and is delivered by a one-shot check once it does.
+    """
+    EVENT = '<<Y2Wakeup>>'
+
+    def __init__(self, widget, callback):
+        self.widget = widget
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._pending = False
+        self.threaded = widget.tk.eval('info exists tcl_platform(threaded)') == '1'
+        widget.bind(self.EVENT, self._on_event, add="+")
+        if self.threaded:
+            widget.after_idle(self._check_missed)
+        else:
+            self._poll()
 
-        self.cancel_button = ctk.CTkButton(self.actions_frame, text="Cancel", command=self.cancel, fg_color="#d9534f", hover_color="#c9302c")
-        self.cancel_button.pack(side="right")
+    def notify(self):
+        if not self.threaded:
+            return
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        try:
+            self.widget.event_generate(self.EVENT, when='tail')
+        except (RuntimeError, tk.TclError):
+            # The main loop is not running. Stay pending, so other threads do not
+            # each block on the same failure; _check_missed delivers it at startup.
+            pass
 
-        self.open_folder_button = ctk.CTkButton(self.actions_frame, text="Open Folder", command=self.open_containing_folder)
-        self.play_file_button = ctk.CTkButton(self.actions_frame, text="Play File", command=self.play_file)
+    def _on_event(self, event=None):
+        with self._lock:
+            self._pending = False
+        self.callback()
+
+    def _check_missed(self):
+        # Runs once, from inside the main loop, after which posting can no longer fail.
+        if self._pending:
+            self._on_event()
+
+    def _poll(self):
+        self.callback()
+        self.widget.after(FALLBACK_POLL_INTERVAL, self._poll)
+
+# --- Downloads List ---
+class TaskViewState:
+    """ Display state of one download, kept separate from any widget. """
+    __slots__ = ('title', 'state', 'status_text', 'status_color', 'progress', 'progress_text',
+                 'size_text', 'time_text', 'thumbnail', 'thumbnail_requested', 'version')
+
+    def __init__(self, title):
+        self.title = title
+        self.state = 'queued'
+        self.status_text = "Queued"
+        self.status_color = None
+        self.progress = 0.0
+        self.progress_text = "Download Progress: 0.00%"
+        self.size_text = "Downloaded: 0.00 MB / 0.00 MB"
+        self.time_text = "Elapsed Time: 0.00 seconds"
+        self.thumbnail = None
+        self.thumbnail_requested = False
+        self.version = 0
+
+TERMINAL_STATES = frozenset({'finished', 'error', 'cancelled'})
+
+class DownloadTask(DownloadJob):
+    def __init__(self, list_view, url, folder, quality_format, is_playlist, info_dict, priority=0, journal_id=None):
+        super().__init__(url, folder, quality_format, is_playlist, info_dict, priority, journal_id)
+        self.list_view = list_view
+        self.view = TaskViewState(self.info_dict.get('title', 'Unknown Title'))
+
+        self.list_view.add(self)
+        self.start_download()
 
-    def start_download(self):
-        self.start_time = time.time()
-        active_downloads[self.task_id] = self
-        thread = threading.Thread(target=self._download_thread, daemon=True)
-        thread.start()
+    def _changed(self):
+        self.view.version += 1
+        self.list_view.mark_dirty()
 
-    def _progress_hook(self, d):
-        if self.cancel_flag:
-            raise yt_dlp.utils.DownloadError("Download canceled by the user")
-        if d['status'] == 'downloading':
-            total_size = d.get('total_bytes') or d.get('total_bytes_estimate')
-            downloaded_size = d.get('downloaded_bytes', 0)
-            if total_size and downloaded_size:
-                progress = downloaded_size / total_size
-                downloaded_mb = downloaded_size / (1024 * 1024)
-                total_mb = total_size / (1024 * 1024)
-                elapsed_time = time.time() - self.start_time
-                speed = (downloaded_size / (1024 * 1024)) / elapsed_time if elapsed_time > 0 else 0
-                download_queue.put({
-                    'task_id': self.task_id, 'status': 'downloading',
-                    'progress': progress, 'downloaded_mb': downloaded_mb,
-                    'total_mb': total_mb, 'elapsed_time': elapsed_time,
-                    'speed': speed
-                })
-        elif d['status'] == 'finished':
-            elapsed_time = time.time() - self.start_time
-            download_queue.put({
-                'task_id': self.task_id, 'status': 'finished',
-                'filepath': d.get('filename'), 'elapsed_time': elapsed_time
-            })
-
-    def _download_thread(self):
-        try:
-            output_path = os.path.join(self.folder, '%(title)s.%(ext)s')
-            ydl_opts = {
-                'format': self.quality_format,
-                'outtmpl': output_path,
-                'progress_hooks': [self._progress_hook],
-                'quiet': True,
-                'noplaylist': not self.is_playlist,
-                'ffmpeg_location': FFMPEG_PATH,
-                'postprocessors': [],
-                'user_agent': USER_AGENT,
-                'socket_timeout': 15,
-            }
-            if 'audio' in self.quality_format or self.quality_format == 'bestaudio/best':
-                ydl_opts['postprocessors'].append({
-                    'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192',
-                })
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([self.url])
-        except yt_dlp.utils.DownloadError as e:
-            if "canceled" not in str(e):
-                logging.error(f"DownloadError for {self.url}: {e}")
-                download_queue.put({'task_id': self.task_id, 'status': 'error', 'message': f"Download failed: {e}"})
-        except Exception as e:
-            logging.error(f"Unhandled exception for {self.url}: {e}")
-            download_queue.put({'task_id': self.task_id, 'status': 'error', 'message': f"An error occurred: {e}"})
-        finally:
-            if self.task_id in active_downloads:
-                download_queue.put({'task_id': self.task_id, 'status': 'done'})
+    def request_thumbnail(self):
+        """ Load the row thumbnail the first time the task scrolls into view. """
+        if self.view.thumbnail_requested:
+            return
+        self.view.thumbnail_requested = True
+        thumbnail_url = thumbnail_url_for(self.info_dict)
+        if thumbnail_url:
+            # Carries the task itself: rows scroll into view long after their download left active_downloads.
+            thumbnail_loader.submit(thumbnail_url, lambda img: download_queue.put({'task_id': self.task_id, 'status': 'thumbnail', 'image': img, 'task': self}))
 
     def update_ui(self, data):
+        view = self.view
         status = data.get('status')
-        if status == 'downloading':
-            self.progress_bar.set(data['progress'])
-            self.main_progress_label.configure(text=f"Download Progress: {data['progress'] * 100:.2f}%")
-            self.size_progress_label.configure(text=f"Downloaded: {data['downloaded_mb']:.2f} MB / {data['total_mb']:.2f} MB")
-            self.time_label.configure(text=f"Elapsed Time: {data['elapsed_time']:.2f} seconds, Speed: {data['speed']:.2f} MB/s")
-            self.status_label.configure(text="Downloading...")
+        if status == 'thumbnail':
+            img = data.get('image')
+            if img is None:
+                return
+            view.thumbnail = ctk.CTkImage(light_image=img, dark_image=img, size=ROW_THUMBNAIL_SIZE)
+        elif status == 'started':
+            view.state = 'downloading'
+            view.status_text = "Starting..."
+            view.status_color = None
+        elif status == 'retrying':
+            view.state = 'queued'
+            view.status_text = (f"Retrying in {format_duration(data['delay'])} ({data['reason']}), "
+                                f"attempt {data['attempt'] + 1}/{data['max_attempts']}")
+            view.status_color = "orange"
+        elif status == 'downloading':
+            view.progress = data['progress']
+            view.progress_text = f"Download Progress: {data['progress'] * 100:.2f}%"
+            view.size_text = f"Downloaded: {data['downloaded_mb']:.2f} MB / {data['total_mb']:.2f} MB"
+            view.time_text = f"Elapsed Time: {data['elapsed_time']:.2f} seconds, Speed: {data['speed']:.2f} MB/s, ETA: {format_duration(data.get('eta'))}"
+            view.status_text = "Downloading..."
+        elif status == 'converting':
+            view.state = 'converting'
+            view.progress = data['progress']
+            view.progress_text = f"Converting: {data['progress'] * 100:.2f}%"
+            view.time_text = f"Elapsed Time: {data['elapsed_time']:.2f} seconds"
+            view.status_text = "Converting to MP3..."
         elif status == 'finished':
-            self.progress_bar.set(1)
-            self.main_progress_label.configure(text="Download Progress: 100.00%")
-            self.status_label.configure(text=f"Completed in {data['elapsed_time']:.2f} seconds.")
-            intermediate_path = data.get('filepath')
-            if 'audio' in self.quality_format or self.quality_format == 'bestaudio/best':
-                base, _ = os.path.splitext(intermediate_path)
-                potential_mp3_path = base + '.mp3'
-                self.filepath = potential_mp3_path if os.path.exists(potential_mp3_path) else intermediate_path
-            else:
-                self.filepath = intermediate_path
-            self.cancel_button.pack_forget()
-            self.open_folder_button.pack(side="right", padx=(0, 5))
-            self.play_file_button.pack(side="right", padx=(0, 5))
+            view.state = 'finished'
+            view.progress = 1
+            view.progress_text = "Download Progress: 100.00%"
+            view.status_text = f"Completed in {data['elapsed_time']:.2f} seconds."
+            self.filepath = data.get('filepath')
+        elif status == 'saved':
+            self.filepath = data.get('filepath') or self.filepath
+            return
+        elif status == 'skipped':
+            view.state = 'finished'
+            view.progress = 1
+            view.progress_text = "Download Progress: 100.00%"
+            view.status_text = "Linked from an earlier download." if data.get('linked_from') else "Already downloaded."
+            self.filepath = data.get('filepath')
         elif status == 'error':
-            self.status_label.configure(text=data['message'], text_color="red")
-            self.cancel_button.configure(state="disabled")
+            view.state = 'error'
+            view.status_text = data['message']
+            view.status_color = "red"
         elif status == 'cancelled':
-            self.status_label.configure(text="Download cancelled.", text_color="orange")
-            self.cancel_button.configure(state="disabled")
+            view.state = 'cancelled'
+            view.status_text = "Download cancelled."
+            view.status_color = "orange"
+        else:
+            return
+        self._changed()
 
-    def cancel(self):
-        self.cancel_flag = True
-        self.cancel_button.configure(text="Cancelling...", state="disabled")
-        messagebox.showinfo("Cancelling", f"Attempting to cancel download for: {self.title_label.cget('text')}")
+    def cancel(self, reason='cancelled'):
+        # A timeout comes from the deadline timer thread; it reaches the row through download_queue.
+        if super().cancel(reason) or reason != 'cancelled':
+            return
+        self.view.status_text = "Cancelling..."
+        self._changed()
+        messagebox.showinfo("Cancelling", f"Attempting to cancel download for: {self.view.title}")
+
+    def toggle_pause(self):
+        if download_scheduler.pause(self):
+            self.view.state = 'paused'
+            self.view.status_text = "Paused"
+        elif download_scheduler.resume(self):
+            self.view.state = 'queued'
+            self.view.status_text = "Queued"
+        self._changed()
+
+    def move_to_top(self):
+        download_scheduler.move_to_front(self)
 
     def open_containing_folder(self):
         if self.filepath:
@@ -246,6 +361,315 @@ class DownloadTask:
         else:
             messagebox.showerror("Error", "File not found. It may have been moved or deleted.")
 
+class DownloadRow:
+    """ A reusable set of widgets that displays whichever task it is bound to. """
+    def __init__(self, master):
+        self.task = None
+        self.version = -1
+        self.frame = ctk.CTkFrame(master, corner_radius=10)
+        self.frame.grid_columnconfigure(1, weight=1)
+
+        self.thumbnail_label = ctk.CTkLabel(self.frame, text="", width=ROW_THUMBNAIL_SIZE[0], height=ROW_THUMBNAIL_SIZE[1])
+        self.thumbnail_label.grid(row=0, column=0, rowspan=4, padx=(10, 0), pady=5, sticky="n")
+
+        self.title_label = ctk.CTkLabel(self.frame, text="", font=("Roboto", 14, "bold"), anchor="w")
+        self.title_label.grid(row=0, column=1, padx=10, pady=(5, 0), sticky="ew")
+
+        self.details_label = ctk.CTkLabel(self.frame, text="", font=("Roboto", 12), anchor="w")
+        self.details_label.grid(row=1, column=1, padx=10, sticky="ew")
+
+        self.progress_bar = ctk.CTkProgressBar(self.frame, height=10, corner_radius=5)
+        self.progress_bar.grid(row=2, column=1, padx=10, pady=2, sticky="ew")
+
+        self.status_label = ctk.CTkLabel(self.frame, text="", font=("Roboto", 12, "italic"), anchor="w")
+        self.status_label.grid(row=3, column=1, padx=10, pady=(0, 5), sticky="ew")
+
+        self.actions_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        self.actions_frame.grid(row=0, column=2, rowspan=4, padx=(0, 10), pady=5, sticky="e")
+        self.cancel_button = ctk.CTkButton(self.actions_frame, text="Cancel", width=80, command=lambda: self._call('cancel'), fg_color="#d9534f", hover_color="#c9302c")
+        self.pause_button = ctk.CTkButton(self.actions_frame, text="Pause", width=80, command=lambda: self._call('toggle_pause'))
+        self.move_to_top_button = ctk.CTkButton(self.actions_frame, text="Move to Top", width=80, command=lambda: self._call('move_to_top'))
+        self.open_folder_button = ctk.CTkButton(self.actions_frame, text="Open Folder", width=80, command=lambda: self._call('open_containing_folder'))
+        self.play_file_button = ctk.CTkButton(self.actions_frame, text="Play File", width=80, command=lambda: self._call('play_file'))
+        self.buttons = (self.cancel_button, self.pause_button, self.move_to_top_button, self.open_folder_button, self.play_file_button)
+
+    def _call(self, method):
+        if self.task is not None:
+            getattr(self.task, method)()
+
+    def bind(self, task):
+        """ Show task in this row; does nothing if it is already showing that version. """
+        if task is self.task and task.view.version == self.version:
+            return
+        self.task = task
+        self.version = task.view.version
+        view = task.view
+        task.request_thumbnail()
+        self.thumbnail_label.configure(image=view.thumbnail)
+        self.title_label.configure(text=view.title)
+        self.details_label.configure(text=f"{view.progress_text}  |  {view.size_text}  |  {view.time_text}")
+        self.progress_bar.set(view.progress)
+        self.status_label.configure(text=view.status_text, text_color=view.status_color or ctk.ThemeManager.theme["CTkLabel"]["text_color"])
+
+        if view.state == 'queued':
+            visible = (self.cancel_button, self.pause_button, self.move_to_top_button)
+        elif view.state == 'paused':
+            visible = (self.cancel_button, self.pause_button)
+        elif view.state in ('downloading', 'converting'):
+            visible = (self.cancel_button,)
+        elif view.state == 'finished':
+            visible = (self.open_folder_button, self.play_file_button)
+        else:
+            visible = ()
+        self.pause_button.configure(text="Resume" if view.state == 'paused' else "Pause")
+        self.cancel_button.configure(state="disabled" if task.cancel_flag else "normal")
+        for button in self.buttons:
+            button.pack_forget()
+        for button in visible:
+            button.pack(side="top", pady=1)
+
+    def unbind(self):
+        self.task = None
+        self.version = -1
+
+class DownloadListView(ctk.CTkFrame):
+    """ Virtualized list of download tasks.
+
+    Only enough DownloadRow widgets to fill the visible area are created; on
+    scroll or when a task changes, the rows are re-bound to the tasks in view.
+    Finished tasks can be archived so the list stays short.
+    """
+    ROW_HEIGHT = 120
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, corner_radius=10, **kwargs)
+        self.items = []
+        self.archived_count = 0
+        self.first_index = 0
+        self.rows = []
+        self._dirty = True
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.grid(row=0, column=0, columnspan=2, padx=10, pady=(5, 0), sticky="ew")
+        header.grid_columnconfigure(1, weight=1)
+        ctk.CTkLabel(header, text="Downloads", font=("Roboto", 14, "bold")).grid(row=0, column=0, sticky="w")
+        self.summary_label = ctk.CTkLabel(header, text="", font=("Roboto", 12))
+        self.summary_label.grid(row=0, column=1, padx=10, sticky="w")
+        ctk.CTkButton(header, text="Archive Completed", width=130, command=self.archive_completed).grid(row=0, column=2, sticky="e")
+
+        self.body = ctk.CTkFrame(self, fg_color="transparent")
+        self.body.grid(row=1, column=0, sticky="nsew", padx=(5, 0), pady=5)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", pady=5)
+
+        self.body.bind("<Configure>", self._on_resize)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.bind_all(sequence, self._on_mousewheel, add="+")
+
+    def add(self, task):
+        self.items.append(task)
+        self.mark_dirty()
+
+    def mark_dirty(self):
+        if not self._dirty:
+            self._dirty = True
+            self.after_idle(self.refresh)
+
+    def archive_completed(self):
+        """ Drop finished, failed and cancelled tasks from the list. """
+        remaining = [task for task in self.items if task.view.state not in TERMINAL_STATES]
+        self.archived_count += len(self.items) - len(remaining)
+        self.items = remaining
+        self.first_index = min(self.first_index, self._max_first_index())
+        self.mark_dirty()
+
+    def _row_height(self):
+        return self._apply_widget_scaling(self.ROW_HEIGHT)
+
+    def _capacity(self):
+        return max(1, int(self.body.winfo_height() // self._row_height()))
+
+    def _max_first_index(self):
+        return max(0, len(self.items) - self._capacity())
+
+    def _on_resize(self, event=None):
+        wanted = self._capacity()
+        while len(self.rows) < wanted:
+            self.rows.append(DownloadRow(self.body))
+        while len(self.rows) > wanted:
+            self.rows.pop().frame.destroy()
+        self.first_index = min(self.first_index, self._max_first_index())
+        self.mark_dirty()
+
+    def scroll_to(self, index):
+        index = max(0, min(int(index), self._max_first_index()))
+        if index != self.first_index:
+            self.first_index = index
+            self.mark_dirty()
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * len(self.items))
+        elif args[0] == 'scroll':
+            step = int(args[1]) * (self._capacity() if args[2] == 'pages' else 1)
+            self.scroll_to(self.first_index + step)
+        self.refresh()
+
+    def _on_mousewheel(self, event):
+        if not str(event.widget).startswith(str(self)):
+            return
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0:
+            self.scroll_to(self.first_index - 1)
+        else:
+            self.scroll_to(self.first_index + 1)
+        self.refresh()
+
+    def refresh(self):
+        """ Re-bind visible rows if anything changed since the last call. Cheap when idle. """
+        if not self._dirty:
+            return
+        self._dirty = False
+        row_height = self._row_height()
+        visible = self.items[self.first_index:self.first_index + len(self.rows)]
+        for i, row in enumerate(self.rows):
+            if i < len(visible):
+                row.bind(visible[i])
+                row.frame.place(x=0, y=i * row_height, relwidth=1, height=row_height - 5)
+            else:
+                row.unbind()
+                row.frame.place_forget()
+        total = len(self.items)
+        if total:
+            self.scrollbar.set(self.first_index / total, (self.first_index + len(visible)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+        active = sum(1 for task in self.items if task.view.state not in TERMINAL_STATES)
+        summary = f"{active} active, {total - active} completed"
+        if self.archived_count:
+            summary += f", {self.archived_count} archived"
+        self.summary_label.configure(text=summary)
+
+# --- Batch Import ---
+class BatchItemRow:
+    """ One URL of a batch: its title/status and a quality box that fills in once details arrive. """
+    def __init__(self, master, url):
+        self.url = url
+        self.info_dict = None
+        self.quality_map = {}
+        self.frame = ctk.CTkFrame(master, corner_radius=6)
+        self.frame.grid_columnconfigure(0, weight=1)
+        self.title_label = ctk.CTkLabel(self.frame, text=url, anchor="w", font=("Roboto", 12, "bold"))
+        self.title_label.grid(row=0, column=0, padx=10, pady=(5, 0), sticky="ew")
+        self.status_label = ctk.CTkLabel(self.frame, text="Loading details...", anchor="w", font=("Roboto", 11, "italic"))
+        self.status_label.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="ew")
+        self.quality_combobox = ctk.CTkComboBox(self.frame, values=["Loading..."], state="disabled", width=260)
+        self.quality_combobox.set("Loading...")
+        self.quality_combobox.grid(row=0, column=1, rowspan=2, padx=10, pady=5)
+
+    def show_result(self, info_dict, error_message):
+        if error_message or not info_dict:
+            self.status_label.configure(text=error_message or "No details found.", text_color="red")
+            self.quality_combobox.set("Unavailable")
+            return
+        self.info_dict = info_dict
+        self.title_label.configure(text=info_dict.get('title') or self.url)
+        duration = info_dict.get('duration') or 0
+        self.status_label.configure(text=f"{info_dict.get('uploader', 'Unknown Uploader')} - {duration // 60}m {duration % 60}s")
+        options = quality_options_for(info_dict)
+        self.quality_map = {display: f_id for f_id, display in options}
+        self.quality_combobox.configure(values=[display for _, display in options], state="readonly")
+        self.quality_combobox.set(options[0][1])
+
+    def selected_format(self):
+        return self.quality_map.get(self.quality_combobox.get())
+
+class BatchImportWindow(ctk.CTkToplevel):
+    """ Paste or import many URLs, load their details concurrently and queue them all. """
+    def __init__(self, app, text=""):
+        super().__init__(app)
+        self.app = app
+        self.title("Batch Import")
+        self.geometry("760x600")
+        self.rows = {}
+        self.token = None
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+
+        self.urls_textbox = ctk.CTkTextbox(self, height=120)
+        self.urls_textbox.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.urls_textbox.insert("1.0", text)
+
+        buttons = ctk.CTkFrame(self, fg_color="transparent")
+        buttons.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+        ctk.CTkButton(buttons, text="Import File...", command=self.import_file, width=110).pack(side="left", padx=(0, 5))
+        ctk.CTkButton(buttons, text="Load All", command=self.load_all, width=110).pack(side="left", padx=5)
+        self.summary_label = ctk.CTkLabel(buttons, text="")
+        self.summary_label.pack(side="left", padx=10)
+        self.download_button = ctk.CTkButton(buttons, text="Download All", command=self.download_all, width=120, state="disabled")
+        self.download_button.pack(side="right")
+
+        self.rows_frame = ctk.CTkScrollableFrame(self)
+        self.rows_frame.grid(row=2, column=0, padx=10, pady=(5, 10), sticky="nsew")
+        self.rows_frame.grid_columnconfigure(0, weight=1)
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        if text.strip():
+            self.after_idle(self.load_all)
+
+    def import_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.urls_textbox.insert("end", "\n" + f.read())
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not read {path}: {e}")
+
+    def load_all(self):
+        urls = [url for url in parse_url_list(self.urls_textbox.get("1.0", "end")) if url not in self.rows]
+        if not urls:
+            return
+        for url in urls:
+            row = BatchItemRow(self.rows_frame, url)
+            row.frame.grid(row=len(self.rows), column=0, padx=5, pady=3, sticky="ew")
+            self.rows[url] = row
+        self.token = self.token or CancelToken()
+        metadata_prefetcher.submit(urls, lambda url, info, error: details_queue.put(
+            {'batch': self, 'url': url, 'info_dict': info, 'error_message': error}), token=self.token)
+        self._update_summary()
+
+    def show_result(self, data):
+        row = self.rows.get(data['url'])
+        if row is not None:
+            row.show_result(data['info_dict'], data['error_message'])
+            self._update_summary()
+
+    def _update_summary(self):
+        ready = sum(1 for row in self.rows.values() if row.info_dict)
+        self.summary_label.configure(text=f"{ready} of {len(self.rows)} ready")
+        self.download_button.configure(state="normal" if ready else "disabled")
+
+    def download_all(self):
+        folder = self.app.folder_path.get()
+        if not os.path.isdir(folder):
+            messagebox.showerror("Error", "The selected download folder does not exist.")
+            return
+        for url, row in list(self.rows.items()):
+            quality_format = row.selected_format()
+            if row.info_dict and quality_format:
+                DownloadTask(self.app.downloads_list, url, folder, quality_format, False, row.info_dict)
+                row.frame.destroy()
+                del self.rows[url]
+        self._update_summary()
+
+    def close(self):
+        if self.token is not None:
+            self.token.cancel()
+        self.destroy()
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -256,12 +680,54 @@ class App(ctk.CTk):
 
         self.info_dict = None
         self.thumbnail_photo = None
+        self.coalesced_shown = 0
+        self.playlist_expansions = []
+        self.stats_refreshed_at = 0
+        self._frame_after = None
+        self._frame_due = 0.0
+        self._last_frame_at = 0.0
 
         self._create_widgets()
+        # Workers wake the loop when they publish events; nothing runs on a timer while idle.
+        self.wakeup = TkWakeup(self, self.schedule_frame)
+        download_queue.wakeup = details_queue.wakeup = expansion_queue.wakeup = self.wakeup.notify
         self.process_queues()
-        if not FFMPEG_PATH:
+        # Importing yt-dlp and probing for ffmpeg happen after the window is up.
+        self.after(100, self._start_warm_up)
+        self.after_idle(self.resume_unfinished_downloads)
+
+    def _start_warm_up(self):
+        self.warm_up_thread = threading.Thread(target=self._warm_up, daemon=True)
+        self.warm_up_thread.start()
+        self.after(200, self._check_warm_up)
+
+    def _warm_up(self):
+        warm_up()
+        job_journal.verify(repair=True)
+        job_journal.compact()
+
+    def _check_warm_up(self):
+        if self.warm_up_thread.is_alive():
+            self.after(200, self._check_warm_up)
+            return
+        if not get_ffmpeg_location():
             messagebox.showwarning("FFmpeg Not Found", f"FFmpeg not found. Downloads requiring format merging or audio conversion may fail.")
 
+    def resume_unfinished_downloads(self):
+        unfinished = job_journal.unfinished()
+        if not unfinished:
+            return
+        if not messagebox.askyesno("Resume Downloads", f"{len(unfinished)} download(s) did not finish last time. Resume them?"):
+            job_journal.abandon_unfinished()
+            return
+        for job in unfinished:
+            if not os.path.isdir(job['folder']):
+                logging.warning(f"Not resuming {job['url']}: folder {job['folder']} is missing")
+                job_journal.abandon(job['journal_id'])  # or it would be offered again on every launch
+                continue
+            DownloadTask(self.downloads_list, job['url'], job['folder'], job['quality_format'], bool(job['is_playlist']),
+                         {'title': job['title'] or job['url']}, journal_id=job['journal_id'])
+
     def _create_widgets(self):
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(3, weight=1)
@@ -277,6 +743,9 @@ class App(ctk.CTk):
         paste_button = ctk.CTkButton(input_frame, text="Paste", command=self.paste_from_clipboard, width=80)
         paste_button.grid(row=0, column=2, padx=(0, 10), pady=10)
 
+        batch_button = ctk.CTkButton(input_frame, text="Batch...", command=self.open_batch_import, width=80)
+        batch_button.grid(row=1, column=2, padx=(0, 10), pady=(0, 10))
+
         self.load_details_button = ctk.CTkButton(input_frame, text="Load Details", command=self.start_load_video_details_thread)
         self.load_details_button.grid(row=0, column=3, padx=10, pady=10)
 
@@ -310,15 +779,43 @@ class App(ctk.CTk):
         self.playlist_combobox = ctk.CTkComboBox(details_options_frame, variable=self.playlist_var, values=["Single Video", "Entire Playlist"], state="readonly")
         self.playlist_combobox.grid(row=3, column=1, padx=10, pady=5, sticky="ew")
 
+        self.refresh_cache_var = tk.IntVar(value=0)
+        self.refresh_cache_checkbox = ctk.CTkCheckBox(details_options_frame, text="Refresh cached details", variable=self.refresh_cache_var)
+        self.refresh_cache_checkbox.grid(row=3, column=2, padx=10, pady=5, sticky="w")
+
         action_frame = ctk.CTkFrame(self, corner_radius=10)
         action_frame.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
         action_frame.grid_columnconfigure(0, weight=1)
         self.download_button = ctk.CTkButton(action_frame, text="Download", command=self.start_new_download, height=40, font=("Roboto", 16, "bold"), state="disabled")
         self.download_button.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
 
-        downloads_container = ctk.CTkScrollableFrame(self, label_text="Downloads")
-        downloads_container.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
-        self.downloads_frame = downloads_container
+        ctk.CTkLabel(action_frame, text="Parallel downloads:").grid(row=0, column=1, padx=(10, 5), pady=10)
+        self.concurrency_var = tk.StringVar(value=str(download_scheduler.max_workers))
+        self.concurrency_combobox = ctk.CTkComboBox(action_frame, variable=self.concurrency_var, values=MAX_CONCURRENT_DOWNLOADS_CHOICES, state="readonly", width=70, command=self.set_max_concurrent_downloads)
+        self.concurrency_combobox.grid(row=0, column=2, padx=(0, 10), pady=10)
+
+        ctk.CTkLabel(action_frame, text="Speed limit:").grid(row=0, column=3, padx=(10, 5), pady=10)
+        self.speed_limit_var = tk.StringVar(value=SPEED_LIMIT_CHOICES[0])
+        self.speed_limit_combobox = ctk.CTkComboBox(action_frame, variable=self.speed_limit_var, values=SPEED_LIMIT_CHOICES, width=110, command=self.set_speed_limit)
+        self.speed_limit_combobox.grid(row=0, column=4, padx=(0, 10), pady=10)
+        self.speed_limit_combobox.bind("<Return>", lambda event: self.set_speed_limit(self.speed_limit_var.get()))
+
+        ctk.CTkLabel(action_frame, text="Connections:").grid(row=0, column=5, padx=(10, 5), pady=10)
+        self.segments_var = tk.StringVar(value=str(DownloadJob.segments))
+        self.segments_combobox = ctk.CTkComboBox(action_frame, variable=self.segments_var, values=SEGMENT_CHOICES, state="readonly", width=60, command=self.set_download_segments)
+        self.segments_combobox.grid(row=0, column=6, padx=(0, 10), pady=10)
+
+        self.pipeline_stats_label = ctk.CTkLabel(action_frame, text="Coalesced progress updates: 0", font=("Roboto", 11))
+        self.pipeline_stats_label.grid(row=1, column=0, columnspan=3, padx=10, pady=(0, 5), sticky="w")
+
+        self.bandwidth_label = ctk.CTkLabel(action_frame, text="", font=("Roboto", 11))
+        self.bandwidth_label.grid(row=1, column=1, columnspan=6, padx=10, pady=(0, 5), sticky="e")
+
+        self.expansion_label = ctk.CTkLabel(action_frame, text="", font=("Roboto", 12))
+        self.expansion_cancel_button = ctk.CTkButton(action_frame, text="Stop Expanding", command=self.cancel_playlist_expansions, width=120, fg_color="#d9534f", hover_color="#c9302c")
+
+        self.downloads_list = DownloadListView(self)
+        self.downloads_list.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
 
     def toggle_theme(self):
         if self.theme_switch.get() == 1:
@@ -329,10 +826,16 @@ class App(ctk.CTk):
     def paste_from_clipboard(self):
         try:
             clipboard_content = self.clipboard_get()
-            self.url_entry.delete(0, "end")
-            self.url_entry.insert(0, clipboard_content)
         except tk.TclError:
-            pass
+            return
+        if len(parse_url_list(clipboard_content)) > 1:
+            self.open_batch_import(clipboard_content)
+            return
+        self.url_entry.delete(0, "end")
+        self.url_entry.insert(0, clipboard_content)
+
+    def open_batch_import(self, text=""):
+        BatchImportWindow(self, text)
 
     def is_valid_youtube_url(self, url):
         youtube_regex = (
@@ -363,80 +866,43 @@ class App(ctk.CTk):
         self.progress_bar.start()
         self.update_idletasks()
 
-        thread = threading.Thread(target=self._load_video_details_in_thread, args=(url,), daemon=True)
+        is_playlist = self.playlist_var.get() == "Entire Playlist"
+        refresh = self.refresh_cache_var.get() == 1
+        self.details_token = CancelToken()
+        self.load_details_button.configure(text="Cancel", state="normal", command=self.details_token.cancel)
+        thread = threading.Thread(target=self._load_video_details_in_thread, args=(url, is_playlist, refresh, self.details_token), daemon=True)
         thread.start()
 
-    def _load_video_details_in_thread(self, url):
+    def _load_video_details_in_thread(self, url, is_playlist=False, refresh=False, token=None):
         logging.info(f"Thread started for {url}")
-        info_dict = None
-        thumbnail_img_data = None
-        error_message = None
-        retries = 3
-        retry_delay = 2
-
-        for attempt in range(retries):
-            try:
-                with timeout(30):
-                    ydl_opts = {
-                        'quiet': True,
-                        'skip_download': True,
-                        'user_agent': USER_AGENT,
-                        'cachedir': False,
-                        'skip_update': True,
-                        'nocheckcertificate': True,
-                        'socket_timeout': 15,
-                    }
-                    if self.playlist_var.get() == "Entire Playlist":
-                        ydl_opts['extract_flat'] = True
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info_dict = ydl.extract_info(url, download=False)
-                thumbnail_url = info_dict.get('thumbnail')
-                if thumbnail_url:
-                    response = requests.get(thumbnail_url, timeout=10, headers={'User-Agent': USER_AGENT})
-                    response.raise_for_status()
-                    thumbnail_img_data = BytesIO(response.content)
-                break
-            except TimeoutError:
-                logging.warning(f"Timeout on attempt {attempt + 1} for {url}")
-                error_message = "Operation timed out while loading video details."
-                if attempt < retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-            except yt_dlp.utils.DownloadError as e:
-                error_message = f"Could not load video details: {e}"
-                logging.error(f"yt-dlp error loading details for {url}: {e}")
-                if attempt < retries - 1:
-                    time.sleep(retry_delay)
-                    continue
-            except Exception as e:
-                error_message = f"An unexpected error occurred: {e}"
-                logging.error(f"Unhandled exception loading details for {url}: {e}")
-                break
-        else:
-            logging.error(f"All {retries} attempts failed for {url}")
-
+        info_dict, error_message = fetch_video_details(url, is_playlist, refresh, token=token)
+        thumbnail_image = thumbnail_loader.get(thumbnail_url_for(info_dict), token.child(THUMBNAIL_TIMEOUT)) if info_dict else None
         logging.info(f"Thread completed for {url}")
         details_queue.put({
             'info_dict': info_dict,
-            'thumbnail_img_data': thumbnail_img_data,
-            'error_message': error_message
+            'thumbnail_image': thumbnail_image,
+            'error_message': error_message,
+            'cancelled': token.cancelled and token.reason != 'timeout',
         })
 
     def _update_details_ui(self, data):
         if hasattr(self, 'progress_bar'):
             self.progress_bar.stop()
             self.progress_bar.grid_forget()
-        self.load_details_button.configure(text="Load Details", state="normal")
+        self.load_details_button.configure(text="Load Details", state="normal", command=self.start_load_video_details_thread)
         self.thumbnail_photo = None
         self.info_dict = None
 
         info_dict = data.get('info_dict')
-        thumbnail_img_data = data.get('thumbnail_img_data')
+        thumbnail_image = data.get('thumbnail_image')
         error_message = data.get('error_message')
 
         if error_message:
-            messagebox.showerror("Error", error_message)
-            self.video_info_label.configure(text="Failed to load details.")
+            if data.get('cancelled'):
+                self.video_info_label.configure(text="Loading cancelled.")
+            else:
+                messagebox.showerror("Error", error_message)
+                self.video_info_label.configure(text="Failed to load details.")
             self.quality_combobox.configure(values=["Load details first"], state="readonly")
             self.quality_combobox.set("Load details first")
             self.thumbnail_label.configure(image=None)
@@ -449,10 +915,9 @@ class App(ctk.CTk):
         info_text = f"Title: {title}\nDuration: {duration // 60}m {duration % 60}s\nUploader: {uploader}"
         self.video_info_label.configure(text=info_text)
 
-        if thumbnail_img_data:
+        if thumbnail_image:
             try:
-                img = Image.open(thumbnail_img_data)
-                img.thumbnail((160, 90), Image.Resampling.LANCZOS)
+                img = thumbnail_image
                 self.thumbnail_photo = ctk.CTkImage(light_image=img, dark_image=img, size=(img.width, img.height))
                 self.thumbnail_label.configure(image=self.thumbnail_photo)
             except Exception as e:
@@ -461,22 +926,7 @@ class App(ctk.CTk):
         else:
             self.thumbnail_label.configure(image=None)
 
-        formats = info_dict.get('formats', [])
-        quality_options = []
-        for f in formats:
-            if f.get('vcodec') != 'none' and f.get('acodec') != 'none':
-                resolution = f.get('height', 'Unknown') if f.get('height') else 'Unknown Resolution'
-                ext = f.get('ext', 'mp4')
-                filesize = f.get('filesize') or f.get('filesize_approx')
-                size_mb = f"{filesize / (1024*1024):.2f} MB" if filesize else "Unknown size"
-                quality_options.append((f['format_id'], f"Video: {resolution}p ({ext}) - {size_mb}"))
-            elif f.get('vcodec') == 'none' and f.get('acodec') != 'none':
-                ext = f.get('ext', 'mp3')
-                filesize = f.get('filesize') or f.get('filesize_approx')
-                size_mb = f"{filesize / (1024*1024):.2f} MB" if filesize else "Unknown size"
-                quality_options.append((f['format_id'], f"Audio: {ext.upper()} - {size_mb}"))
-        quality_options.append(('bestaudio/best', "Audio only (mp3) - Best Quality"))
-
+        quality_options = quality_options_for(info_dict)
         if quality_options:
             self.quality_combobox.configure(values=[q[1] for q in quality_options], state="readonly")
             self.quality_map = {display: f_id for f_id, display in quality_options}
@@ -488,6 +938,26 @@ class App(ctk.CTk):
             self.quality_combobox.set("No formats found")
             self.download_button.configure(state="disabled")
 
+    def set_max_concurrent_downloads(self, value):
+        download_scheduler.set_max_workers(int(value))
+        logging.info(f"Max concurrent downloads set to {value}")
+
+    def set_download_segments(self, value):
+        # Applies to downloads that start from now on.
+        DownloadJob.segments = int(value)
+        logging.info(f"Connections per download set to {value}")
+
+    def set_speed_limit(self, value):
+        """ Accepts the presets or anything parse_rate understands, e.g. '3M' or '750K'. """
+        try:
+            rate = parse_rate(value)
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid speed limit: {value}. Use e.g. 500K or 2M.")
+            self.speed_limit_var.set(SPEED_LIMIT_CHOICES[0] if not bandwidth_governor.rate else f"{bandwidth_governor.rate // 1024}K")
+            return
+        bandwidth_governor.set_rate(rate)
+        logging.info(f"Total download speed limit set to {rate} bytes/s")
+
     def browse_folder(self):
         folder_selected = filedialog.askdirectory()
         if folder_selected:
@@ -518,37 +988,122 @@ class App(ctk.CTk):
             return
 
         if is_playlist:
-            with yt_dlp.YoutubeDL({'quiet': True, 'extract_flat': True, 'user_agent': USER_AGENT}) as ydl:
-                playlist_info = ydl.extract_info(url, download=False)
-                for entry in playlist_info.get('entries', []):
-                    DownloadTask(self.downloads_frame, entry['url'], folder, quality_format_id, False, entry)
+            # The details view already holds the flat playlist when it was loaded in playlist mode.
+            playlist_info = self.info_dict if self.info_dict.get('entries') is not None else None
+            expansion = PlaylistExpansion(url, folder, quality_format_id, playlist_info)
+            self.playlist_expansions.append(expansion)
+            self._update_expansion_ui()
+            threading.Thread(target=expansion.run, args=(expansion_queue,), daemon=True).start()
         else:
-            DownloadTask(self.downloads_frame, url, folder, quality_format_id, is_playlist, self.info_dict)
+            DownloadTask(self.downloads_list, url, folder, quality_format_id, is_playlist, self.info_dict)
+
+    def cancel_playlist_expansions(self):
+        for expansion in self.playlist_expansions:
+            expansion.cancel()
+        self.expansion_cancel_button.configure(state="disabled")
+
+    def _update_expansion_ui(self):
+        if not self.playlist_expansions:
+            self.expansion_label.grid_forget()
+            self.expansion_cancel_button.grid_forget()
+            return
+        expanded = sum(e.expanded for e in self.playlist_expansions)
+        if all(e.total is not None for e in self.playlist_expansions):
+            total = sum(e.total for e in self.playlist_expansions)
+            text = f"Expanding playlist: {expanded} of {total} expanded"
+        else:
+            text = f"Expanding playlist: {expanded} expanded"
+        self.expansion_label.configure(text=text)
+        self.expansion_label.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="w")
+        self.expansion_cancel_button.configure(state="normal")
+        self.expansion_cancel_button.grid(row=2, column=6, padx=(0, 10), pady=(0, 10))
+
+    def _process_expansion_event(self, data):
+        expansion = data['expansion']
+        if data.get('finished'):
+            if expansion in self.playlist_expansions:
+                self.playlist_expansions.remove(expansion)
+            if data.get('error_message'):
+                messagebox.showerror("Error", data['error_message'])
+            return
+        if expansion.cancelled:
+            return
+        for entry in data['entries']:
+            entry_url = entry.get('url') or entry.get('webpage_url')
+            DownloadTask(self.downloads_list, entry_url, expansion.folder, expansion.quality_format, False, entry)
+
+    def _update_bandwidth_ui(self):
+        stats = aggregate_stats()
+        text = (f"Total: {stats['rate'] / (1024 * 1024):.2f} MB/s  |  {stats['running']} active, "
+                f"{stats['queued'] + stats['paused']} queued  |  ETA: {format_duration(stats['eta'])}")
+        if text != self.bandwidth_label.cget('text'):
+            self.bandwidth_label.configure(text=text)
+
+    def schedule_frame(self, delay=0.0):
+        """ Run process_queues in delay seconds, but no sooner than MIN_FRAME_INTERVAL after the last frame. """
+        now = time.monotonic()
+        due = max(now + delay, self._last_frame_at + MIN_FRAME_INTERVAL)
+        if self._frame_after is not None:
+            if self._frame_due <= due:
+                return
+            self.after_cancel(self._frame_after)
+        self._frame_due = due
+        self._frame_after = self.after(max(0, int((due - now) * 1000)), self.process_queues)
 
     def process_queues(self):
+        self._frame_after = None
+        self._last_frame_at = time.monotonic()
+        for data in download_queue.drain(MAX_UI_UPDATES_PER_FRAME):
+            task_id = data.get('task_id')
+            task = active_downloads.get(task_id) or data.get('task')
+            if task:
+                task.update_ui(data)
+                if data['status'] == 'done':
+                    if task_id in active_downloads:
+                        del active_downloads[task_id]
+        self.downloads_list.refresh()
+        now = time.monotonic()
+        if now - self.stats_refreshed_at >= STATS_REFRESH_INTERVAL:
+            self.stats_refreshed_at = now
+            self._update_bandwidth_ui()
+        if download_queue.coalesced_count != self.coalesced_shown:
+            self.coalesced_shown = download_queue.coalesced_count
+            self.pipeline_stats_label.configure(text=f"Coalesced progress updates: {self.coalesced_shown}")
+
+        batches = 0
         try:
-            while not download_queue.empty():
-                data = download_queue.get_nowait()
-                task_id = data.get('task_id')
-                task = active_downloads.get(task_id)
-                if task:
-                    task.update_ui(data)
-                    if data['status'] == 'done':
-                        if task_id in active_downloads:
-                            del active_downloads[task_id]
+            while batches < MAX_PLAYLIST_BATCHES_PER_FRAME and not expansion_queue.empty():
+                self._process_expansion_event(expansion_queue.get_nowait())
+                batches += 1
         except queue.Empty:
             pass
+        if batches:
+            self._update_expansion_ui()
 
         try:
             while not details_queue.empty():
                 data = details_queue.get_nowait()
+                batch = data.get('batch')
+                if batch is not None:
+                    if batch.winfo_exists():
+                        batch.show_result(data)
+                    continue
                 self._update_details_ui(data)
                 self.update_idletasks()
         except queue.Empty:
             pass
 
-        self.after(50, self.process_queues)
+        if not download_queue.empty() or not expansion_queue.empty():
+            self.schedule_frame()  # a burst exceeded this frame's budget
+        elif active_downloads:
+            self.schedule_frame(STATS_REFRESH_INTERVAL)  # keep the totals and ETA ticking
 
 if __name__ == "__main__":
+    setup_logging()
+    # Optional metrics export, e.g. Y2_METRICS_PORT=9464 or Y2_STATS_FILE=~/y2stats.json
+    if os.environ.get('Y2_METRICS_PORT'):
+        start_metrics_server(int(os.environ['Y2_METRICS_PORT']))
+    if os.environ.get('Y2_STATS_FILE'):
+        start_stats_file_writer(os.path.expanduser(os.environ['Y2_STATS_FILE']))
     app = App()
     app.mainloop()
\ No newline at end of file
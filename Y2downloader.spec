@@ -12,7 +12,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Heavy packages from the build machine that the app never uses; keeping them out
+    # shrinks the one-file archive that has to be unpacked on every launch.
+    excludes=['numpy', 'pandas', 'scipy', 'torch', 'torchvision', 'cv2', 'PyQt6', 'matplotlib'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -31,7 +33,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # UPX-compressed binaries must be decompressed at every start
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -0,0 +1,286 @@
+""" Offline end-to-end benchmark: fake media server + stub extractor driving the download engine.
+
+    python benchmarks/offline_benchmark.py [--workloads 1,10,500] [--size 262144] [--latency 0.02]
+                                           [--server-rate 0] [--concurrency 3] [--headless] [--json]
+
+A local HTTP server serves synthetic media of --size bytes after --latency
+seconds, optionally paced to --server-rate bytes/s per connection. A stub
+yt-dlp extractor maps fakemedia://<id> URLs to that server, so downloads go
+through the real YoutubeDL pool, scheduler, progress hooks and ProgressChannel
+without touching the network.
+
+Events are consumed by App.process_queues when Tk and customtkinter are
+available (with the window withdrawn), otherwise by a headless loop with the
+same per-frame drain budget and wakeup scheme: it sleeps until the channel
+signals new events, and frames are at least UI_FRAME_INTERVAL apart. Each workload runs in a fresh interpreter with
+HOME pointed at a temporary directory, so the journal and caches start empty
+and peak RSS is measured per workload.
+
+Reported per workload: items/s, MB/s, UI event latency (time from a worker
+publishing an event until the UI loop drains it; p50/p95/max) and peak RSS.
+"""
+import argparse
+import http.server
+import importlib.util
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UI_FRAME_INTERVAL = 0.02  # matches MIN_FRAME_INTERVAL in Y2downloader
+IDLE_WAKE_INTERVAL = 0.5  # matches the STATS_REFRESH_INTERVAL heartbeat while downloads run
+HEADLESS_UPDATES_PER_FRAME = 100
+
+# --- Fake media server ---
+class FakeMediaHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves /media/<id>.mp4 as size bytes of filler, honouring Range requests. """
+    size = 0
+    latency = 0.0
+    rate = 0
+    chunk_size = 64 * 1024
+    _chunk = b''
+
+    def do_GET(self):
+        if not self.path.startswith('/media/'):
+            self.send_error(404)
+            return
+        time.sleep(self.latency)
+        start, end = 0, self.size - 1
+        match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+            else:
+                start = max(0, self.size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{self.size}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{self.size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        remaining = end - start + 1
+        try:
+            while remaining > 0:
+                chunk = self._chunk[:min(remaining, self.chunk_size)]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                if self.rate:
+                    time.sleep(len(chunk) / self.rate)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+def start_media_server(size, latency=0.0, rate=0):
+    FakeMediaHandler.size = size
+    FakeMediaHandler.latency = latency
+    FakeMediaHandler.rate = rate
+    FakeMediaHandler._chunk = b'\0' * FakeMediaHandler.chunk_size
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeMediaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# --- Stub extractor ---
+def make_stub_extractor(base_url, size):
+    from yt_dlp.extractor.common import InfoExtractor
+
+    class FakeMediaIE(InfoExtractor):
+        IE_NAME = 'fakemedia'
+        _VALID_URL = r'fakemedia://(?P<id>[\w-]+)'
+
+        def _real_extract(self, url):
+            video_id = self._match_id(url)
+            return {
+                'id': video_id,
+                'title': f'Fake media {video_id}',
+                'duration': 60,
+                'formats': [{
+                    'format_id': 'fake-mp4',
+                    'url': f'{base_url}/media/{video_id}.mp4',
+                    'ext': 'mp4',
+                    'filesize': size,
+                    'vcodec': 'avc1',
+                    'acodec': 'mp4a',
+                }],
+            }
+
+    return FakeMediaIE
+
+# --- Workload (runs in a child process) ---
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _instrument_channel(channel, latencies):
+    """ Record, for every drained event, how long it waited since it was put. """
+    put_times = {}
+    original_put, original_drain = channel.put, channel.drain
+
+    def put(data):
+        put_times[id(data)] = time.perf_counter()
+        original_put(data)
+
+    def drain(max_events=None):
+        items = original_drain(max_events)
+        now = time.perf_counter()
+        for data in items:
+            put_at = put_times.pop(id(data), None)
+            if put_at is not None:
+                latencies.append(now - put_at)
+        return items
+
+    channel.put = put
+    channel.drain = drain
+
+def _run_gui(y2engine, urls, folder, started_jobs):
+    import Y2downloader
+    app = Y2downloader.App()
+    app.withdraw()
+
+    def start_tasks():
+        # Created from inside the main loop, as the app does, so worker wakeups can be posted.
+        for url in urls:
+            started_jobs.append(Y2downloader.DownloadTask(app.downloads_list, url, folder, 'best', False, {'title': url}))
+        app.after(20, check_done)
+
+    def check_done():
+        if not y2engine.active_downloads and y2engine.download_queue.empty():
+            app.quit()
+        else:
+            app.after(20, check_done)
+
+    app.after_idle(start_tasks)
+    app.mainloop()
+    app.destroy()
+
+def _run_headless(y2engine, urls, folder, started_jobs):
+    for url in urls:
+        job = y2engine.DownloadJob(url, folder, 'best', False, {'title': url})
+        job.start_download()
+        started_jobs.append(job)
+    wakeup = threading.Event()
+    y2engine.download_queue.wakeup = wakeup.set
+    while y2engine.active_downloads or not y2engine.download_queue.empty():
+        if y2engine.download_queue.empty():
+            wakeup.wait(IDLE_WAKE_INTERVAL)
+        wakeup.clear()
+        for data in y2engine.download_queue.drain(HEADLESS_UPDATES_PER_FRAME):
+            if data['status'] == 'done':
+                y2engine.active_downloads.pop(data['task_id'], None)
+        time.sleep(UI_FRAME_INTERVAL)
+
+def run_workload(args):
+    import y2engine
+    server = start_media_server(args.size, args.latency, args.server_rate)
+    y2engine.register_extractor(make_stub_extractor(f'http://127.0.0.1:{server.server_port}', args.size))
+    y2engine.download_scheduler.set_max_workers(args.concurrency)
+
+    mode = 'headless'
+    if not args.headless:
+        try:
+            import tkinter
+            tkinter.Tk().destroy()
+            if importlib.util.find_spec('customtkinter') is not None:
+                mode = 'gui'
+        except Exception:
+            pass
+
+    latencies = []
+    _instrument_channel(y2engine.download_queue, latencies)
+    urls = [f'fakemedia://item{i:05d}' for i in range(args.items)]
+    jobs = []
+    with tempfile.TemporaryDirectory() as folder:
+        started = time.perf_counter()
+        if mode == 'gui':
+            _run_gui(y2engine, urls, folder, jobs)
+        else:
+            _run_headless(y2engine, urls, folder, jobs)
+        elapsed = time.perf_counter() - started
+        completed = [job for job in jobs if job.filepath and os.path.exists(job.filepath)]
+        total_bytes = sum(os.path.getsize(job.filepath) for job in completed)
+    server.shutdown()
+    return {
+        'items': args.items,
+        'mode': mode,
+        'completed': len(completed),
+        'elapsed': elapsed,
+        'items_per_sec': len(completed) / elapsed if elapsed else 0.0,
+        'mb_per_sec': total_bytes / (1024 * 1024) / elapsed if elapsed else 0.0,
+        'ui_events': len(latencies),
+        'coalesced': y2engine.download_queue.coalesced_count,
+        'ui_latency_p50_ms': _percentile(latencies, 0.5) * 1000,
+        'ui_latency_p95_ms': _percentile(latencies, 0.95) * 1000,
+        'ui_latency_max_ms': max(latencies, default=0.0) * 1000,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+# --- Driver ---
+def run_child(items, args):
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home)
+        env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+        command = [sys.executable, os.path.abspath(__file__), '--child', '--items', str(items),
+                   '--size', str(args.size), '--latency', str(args.latency), '--server-rate', str(args.server_rate),
+                   '--concurrency', str(args.concurrency)]
+        if args.headless:
+            command.append('--headless')
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workloads', default='1,10,500', help="Comma-separated item counts")
+    parser.add_argument('--size', type=int, default=256 * 1024, help="Bytes per item")
+    parser.add_argument('--latency', type=float, default=0.02, help="Server delay before each response, in seconds")
+    parser.add_argument('--server-rate', type=int, default=0, help="Per-connection pacing in bytes/s (0 = unpaced)")
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--headless', action='store_true', help="Skip the Tk UI even if it is available")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--items', type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_workload(args)))
+        return
+
+    results = [run_child(int(n), args) for n in args.workloads.split(',') if n.strip()]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"size: {args.size} bytes, latency: {args.latency * 1000:.0f} ms, concurrency: {args.concurrency}")
+    print(f"{'items':>6} {'mode':>8} {'done':>6} {'items/s':>9} {'MB/s':>8} {'events':>7} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'max ms':>7} {'RSS MB':>7}")
+    for r in results:
+        rss = f"{r['peak_rss_mb']:7.1f}" if r['peak_rss_mb'] is not None else f"{'n/a':>7}"
+        print(f"{r['items']:>6} {r['mode']:>8} {r['completed']:>6} {r['items_per_sec']:9.2f} {r['mb_per_sec']:8.2f} "
+              f"{r['ui_events']:>7} {r['ui_latency_p50_ms']:7.1f} {r['ui_latency_p95_ms']:7.1f} "
+              f"{r['ui_latency_max_ms']:7.1f} {rss}")
+
+if __name__ == "__main__":
+    main()
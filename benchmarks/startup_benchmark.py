@@ -0,0 +1,87 @@
+""" Startup benchmark: time-to-first-frame of the Tk app and import cost per module.
+
+    python benchmarks/startup_benchmark.py [--runs 5] [--top 15] [--module y2cli]
+
+Each measurement runs in a fresh interpreter with HOME pointed at a temporary
+directory, so the journal, caches and the resume prompt never interfere.
+Time-to-first-frame is measured from process launch until App() has been
+created and its first frame drawn. Import costs come from python -X importtime.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_FRAME_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import Y2downloader
+imported = time.perf_counter()
+app = Y2downloader.App()
+app.update()
+print(json.dumps({'import': imported - started, 'first_frame': time.perf_counter() - started}))
+app.destroy()
+"""
+
+def _env(home):
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+def time_to_first_frame(runs):
+    """ Return a list of {'wall', 'import', 'first_frame'} dicts, one per run. """
+    results = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as home:
+            launched = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', FIRST_FRAME_SCRIPT], cwd=home, env=_env(home),
+                                    capture_output=True, text=True, check=True).stdout
+            wall = time.perf_counter() - launched
+        result = json.loads(output.strip().splitlines()[-1])
+        result['wall'] = wall
+        results.append(result)
+    return results
+
+def import_costs(module):
+    """ Return [(cumulative_us, self_us, name)] for every module imported by `import module`. """
+    with tempfile.TemporaryDirectory() as home:
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=home,
+                                env=_env(home), capture_output=True, text=True, check=True).stderr
+    costs = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        costs.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))
+    return costs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="Number of modules to list by import cost")
+    parser.add_argument('--module', default='Y2downloader', help="Module whose imports are profiled")
+    parser.add_argument('--skip-gui', action='store_true', help="Only profile imports (no display needed)")
+    args = parser.parse_args(argv)
+
+    if not args.skip_gui:
+        results = time_to_first_frame(args.runs)
+        for key in ('wall', 'import', 'first_frame'):
+            values = [r[key] * 1000 for r in results]
+            print(f"{key:>12}: median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+        print()
+
+    costs = import_costs(args.module)
+    top_level = [c for c in costs if not c[2].startswith(' ')]
+    print(f"Total import time of {args.module}: {sum(c[0] for c in top_level) / 1000:.1f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(costs, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name.strip()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+""" Per-item overhead of building a YoutubeDL per download versus borrowing one from ydl_pool.
+
+    python benchmarks/ydl_pool_benchmark.py [--items 200] [--size 4096]
+
+Simulates a long playlist of small items served by a local HTTP server, so
+network time is negligible and the difference is the per-item setup cost.
+"""
+import argparse
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import y2engine  # noqa: E402
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    payload = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, *args):
+        pass
+
+def start_server(size):
+    _Handler.payload = os.urandom(size)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def run_fresh(urls, folder):
+    import yt_dlp
+    started = time.perf_counter()
+    for url in urls:
+        options = dict(y2engine.YDL_PROFILES['download'](), format='best',
+                       outtmpl=os.path.join(folder, 'fresh-%(id)s.%(ext)s'))
+        with yt_dlp.YoutubeDL(options) as ydl:
+            ydl.download([url])
+    return time.perf_counter() - started
+
+def run_pooled(urls, folder):
+    pool = y2engine.YoutubeDLPool()
+    started = time.perf_counter()
+    for url in urls:
+        with pool.session('download', format='best', outtmpl=os.path.join(folder, 'pooled-%(id)s.%(ext)s')) as ydl:
+            ydl.download([url])
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--size', type=int, default=4096, help="Bytes per item")
+    args = parser.parse_args(argv)
+
+    server = start_server(args.size)
+    urls = [f"http://127.0.0.1:{server.server_port}/item{i}.mp4" for i in range(args.items)]
+    y2engine.get_ffmpeg_location()
+    with tempfile.TemporaryDirectory() as folder:
+        fresh = run_fresh(urls, folder)
+        pooled = run_pooled(urls, folder)
+    server.shutdown()
+
+    print(f"items: {args.items}, size: {args.size} bytes")
+    print(f"fresh YoutubeDL per item: {fresh:7.2f} s total, {fresh / args.items * 1000:7.2f} ms/item")
+    print(f"pooled session:           {pooled:7.2f} s total, {pooled / args.items * 1000:7.2f} ms/item")
+    print(f"saved per item:           {(fresh - pooled) / args.items * 1000:7.2f} ms ({(1 - pooled / fresh) * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
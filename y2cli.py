@@ -0,0 +1,216 @@
+""" Headless batch downloader built on y2engine.
+
+Reads URLs (one per line) from a file or stdin, downloads them with the same
+scheduler, retry and progress pipeline as the Tk app, and reports every event
+as a JSON line on stdout followed by a summary line. Videos already downloaded
+with the same format into the same folder are skipped; ones downloaded into
+another folder are linked (or copied) from there instead of fetched again.
+
+    python y2cli.py urls.txt -q "bestvideo+bestaudio/best" -o ~/Videos -j 4
+    cat urls.txt | python y2cli.py -q bestaudio/best
+    python y2cli.py --compact-store
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from y2engine import (
+    DEFAULT_DOWNLOAD_FOLDER, DEFAULT_DOWNLOAD_SEGMENTS, DEFAULT_MAX_CONCURRENT_DOWNLOADS,
+    DOWNLOAD_RETRIES, DownloadJob, PlaylistExpansion, RetryPolicy, active_downloads, aggregate_stats, canonical_media_key,
+    bandwidth_governor, download_queue, download_scheduler, job_journal, parse_rate, parse_schedule,
+    setup_logging, start_metrics_server, start_stats_file_writer,
+)
+
+POLL_INTERVAL = 0.5  # longest sleep between drains when no events arrive
+STATS_INTERVAL = 2.0
+
+def read_urls(source):
+    """ Return the non-empty, non-comment lines of source. """
+    urls = []
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+def emit(record, stream=sys.stdout):
+    stream.write(json.dumps(record, default=str) + '\n')
+    stream.flush()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download YouTube videos without the GUI.")
+    parser.add_argument('urls_file', nargs='?', default='-', help="File with one URL per line, or - for stdin (default)")
+    parser.add_argument('-q', '--quality', default='bestvideo+bestaudio/best', help="yt-dlp format spec; audio formats are converted to mp3")
+    parser.add_argument('-o', '--output', default=DEFAULT_DOWNLOAD_FOLDER, help="Output folder")
+    parser.add_argument('-j', '--concurrency', type=int, default=DEFAULT_MAX_CONCURRENT_DOWNLOADS, help="Parallel downloads")
+    parser.add_argument('--segments', type=int, default=DEFAULT_DOWNLOAD_SEGMENTS, help="Parallel connections per file (HTTP ranges or DASH/HLS fragments); 1 disables splitting")
+    parser.add_argument('--job-timeout', type=float, help="Give up on a download (conversion included) after this many seconds")
+    parser.add_argument('--retries', type=int, default=DOWNLOAD_RETRIES, help="Attempts per download for throttling and network errors (with backoff)")
+    parser.add_argument('--keep-partial', action='store_true', help="Keep .part files of cancelled, timed-out or failed downloads")
+    parser.add_argument('--playlist', action='store_true', help="Expand playlist URLs into one download per entry")
+    parser.add_argument('--limit-rate', type=parse_rate, default=0, help="Total bandwidth cap shared by all downloads, e.g. 2M or 500K")
+    parser.add_argument('--limit-per-task', type=parse_rate, default=0, help="Upper bound for any single download")
+    parser.add_argument('--limit-schedule', type=parse_schedule, default=[], help="Time-of-day caps, e.g. '09:00-17:00=1M,22:00-06:00=0'")
+    parser.add_argument('--limit-file', help="File holding a rate such as 2M; re-read whenever it changes to adjust the cap while running")
+    parser.add_argument('--resume', action='store_true', help="Also resume downloads left unfinished in the journal")
+    parser.add_argument('--log-level', default='WARNING', help="Logging level")
+    parser.add_argument('--log-file', help="Also write logs to this rotating file")
+    parser.add_argument('--log-json', action='store_true', help="Write log records as JSON lines")
+    parser.add_argument('--verify-store', action='store_true', help="Check that every archived download still exists unchanged, then exit")
+    parser.add_argument('--compact-store', action='store_true', help="Drop archive entries for missing or changed files and compact the journal, then exit")
+    parser.add_argument('--metrics-port', type=int, help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    parser.add_argument('--stats-file', help="Periodically write a JSON metrics snapshot to this file")
+    return parser.parse_args(argv)
+
+def _expand_playlist(expansion, jobs, folder, quality_format):
+    try:
+        for batch in expansion.iter_batches():
+            for entry in batch:
+                if expansion.cancelled:
+                    return
+                job = DownloadJob(entry.get('url') or entry.get('webpage_url'), folder, quality_format, False, entry)
+                jobs[job.task_id] = job
+                job.start_download()
+    except Exception as e:
+        logging.error(f"Playlist expansion failed for {expansion.url}: {e}")
+        emit({'event': 'error', 'url': expansion.url, 'message': f"Could not expand playlist: {e}"})
+
+def _reload_limit_file(path, last_mtime):
+    """ Apply the rate in path if it changed since last_mtime; returns the new mtime. """
+    try:
+        mtime = os.path.getmtime(path)
+        if mtime == last_mtime:
+            return last_mtime
+        with open(path, encoding='utf-8') as f:
+            rate = parse_rate(f.read())
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read limit file {path}: {e}")
+        return last_mtime
+    bandwidth_governor.set_rate(rate)
+    emit({'event': 'limit', 'rate': rate})
+    return mtime
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(path=args.log_file, level=args.log_level, json_format=args.log_json, stream=sys.stderr)
+
+    if args.verify_store or args.compact_store:
+        report = job_journal.verify(repair=args.compact_store)
+        if args.compact_store:
+            job_journal.compact(force=True)
+        emit(dict(report, event='store'))
+        return 0 if args.compact_store or report['valid'] == report['checked'] else 1
+
+    if args.urls_file == '-':
+        urls = read_urls(sys.stdin)
+    else:
+        with open(args.urls_file, encoding='utf-8') as f:
+            urls = read_urls(f)
+    if not os.path.isdir(args.output):
+        emit({'event': 'error', 'message': f"Output folder does not exist: {args.output}"})
+        return 2
+
+    if args.metrics_port is not None:
+        start_metrics_server(args.metrics_port)
+    stats_writer = start_stats_file_writer(args.stats_file) if args.stats_file else None
+
+    download_scheduler.set_max_workers(args.concurrency)
+    DownloadJob.segments = max(1, args.segments)
+    DownloadJob.timeout = args.job_timeout
+    DownloadJob.keep_partial_files = args.keep_partial
+    DownloadJob.retry_policy = RetryPolicy(max(1, args.retries))
+    bandwidth_governor.set_rate(args.limit_rate)
+    bandwidth_governor.set_schedule(args.limit_schedule)
+    bandwidth_governor.per_task_limit = args.limit_per_task
+    limit_mtime = None
+    started = time.time()
+    jobs = {}
+    expansions = []
+    expansion_threads = []
+    interrupted = False
+    if args.resume:
+        # Read the journal before this run adds its own queued jobs to it.
+        for row in job_journal.unfinished():
+            job = DownloadJob(row['url'], row['folder'], row['quality_format'], bool(row['is_playlist']),
+                              {'title': row['title'] or row['url']}, journal_id=row['journal_id'])
+            jobs[job.task_id] = job
+            job.start_download()
+    for url in urls:
+        key = canonical_media_key(url, flat=args.playlist) or ''
+        if args.playlist and key.startswith('playlist:'):
+            expansion = PlaylistExpansion(url, args.output, args.quality)
+            thread = threading.Thread(target=_expand_playlist, args=(expansion, jobs, args.output, args.quality), daemon=True)
+            thread.start()
+            expansions.append(expansion)
+            expansion_threads.append(thread)
+        else:
+            job = DownloadJob(url, args.output, args.quality, False, {'title': url})
+            jobs[job.task_id] = job
+            job.start_download()
+
+    outcomes = {}
+    stats_emitted_at = time.monotonic()
+    wakeup = threading.Event()
+    download_queue.wakeup = wakeup.set
+    while True:
+        try:
+            # Expansions register their jobs before finishing, so check them first.
+            expanding = any(t.is_alive() for t in expansion_threads)
+            if interrupted:
+                # An expansion may have registered a job between its cancel and its last check.
+                for job in list(jobs.values()):
+                    if not job.cancel_flag:
+                        job.cancel()
+            for data in download_queue.drain():
+                task_id = data.get('task_id')
+                job = jobs.get(task_id)
+                status = data.get('status')
+                record = {'event': status, 'task_id': task_id, 'url': job.url if job else None}
+                record.update({k: v for k, v in data.items() if k not in ('task_id', 'status')})
+                emit(record)
+                if status in ('error', 'cancelled', 'skipped'):
+                    outcomes[task_id] = status
+                elif status == 'done':
+                    outcomes.setdefault(task_id, 'succeeded')
+                    active_downloads.pop(task_id, None)
+            if not expanding and not active_downloads and download_queue.empty():
+                break
+            if args.limit_file:
+                limit_mtime = _reload_limit_file(args.limit_file, limit_mtime)
+            if time.monotonic() - stats_emitted_at >= STATS_INTERVAL:
+                stats_emitted_at = time.monotonic()
+                emit(dict(aggregate_stats(), event='stats'))
+            if download_queue.empty():
+                wakeup.wait(POLL_INTERVAL)
+            wakeup.clear()
+        except KeyboardInterrupt:
+            if interrupted:
+                expansion_threads = []  # a second Ctrl-C stops waiting for an expansion stuck in a request
+            interrupted = True
+            for expansion in expansions:
+                expansion.cancel()
+            for job in list(jobs.values()):
+                job.cancel()
+
+    summary = {
+        'event': 'summary',
+        'total': len(jobs),
+        'succeeded': sum(1 for o in outcomes.values() if o == 'succeeded'),
+        'failed': sum(1 for o in outcomes.values() if o == 'error'),
+        'cancelled': sum(1 for o in outcomes.values() if o == 'cancelled'),
+        'skipped': sum(1 for o in outcomes.values() if o == 'skipped'),
+        'retries': sum(job.retries for job in jobs.values()),
+        'elapsed_time': round(time.time() - started, 2),
+        'files': [job.filepath for job in jobs.values() if job.filepath],
+    }
+    emit(summary)
+    if stats_writer is not None:
+        stats_writer()
+    return 0 if summary['failed'] == 0 and summary['cancelled'] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
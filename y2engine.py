@@ -0,0 +1,2579 @@
+""" Download engine shared by the Tk app (Y2downloader.py) and the headless CLI (y2cli.py).
+
+Nothing in here may import tkinter, customtkinter or PIL. yt_dlp is imported
+inside the functions that use it so that importing this module stays cheap.
+"""
+import os
+import threading
+import time
+import logging
+import logging.handlers
+import atexit
+import queue
+import sys
+import shutil
+import re
+import json
+import zlib
+import sqlite3
+import heapq
+import itertools
+import uuid
+import random
+import glob
+import subprocess
+import base64
+import hashlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait as futures_wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from contextlib import contextmanager
+from urllib.parse import urlparse, parse_qs
+
+# --- Configuration ---
+DEFAULT_DOWNLOAD_FOLDER = os.path.expanduser("~/Downloads")
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36'
+APP_DATA_DIR = os.path.join(os.path.expanduser("~"), ".y2downloader")
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
+METADATA_CACHE_PATH = os.path.join(APP_DATA_DIR, "metadata_cache.sqlite3")
+METADATA_CACHE_MAX_BYTES = 64 * 1024 * 1024
+METADATA_CACHE_TTL = 24 * 60 * 60
+FORMAT_URL_TTL = 5 * 60 * 60  # YouTube stream URLs expire after ~6 hours
+PLAYLIST_EXPANSION_BATCH_SIZE = 25
+DETAILS_RETRIES = 3
+DETAILS_RETRY_DELAY = 2
+DOWNLOAD_RETRIES = 4  # attempts per download for throttling and transient network errors
+RETRY_BASE_DELAY = 2.0  # retry n waits a random delay up to base * 2**(n - 1) (full jitter)
+RETRY_MAX_DELAY = 120.0
+BREAKER_THRESHOLD = 3  # throttled responses from one host within BREAKER_WINDOW that trip its breaker
+BREAKER_WINDOW = 60.0
+BREAKER_COOLDOWN = 30.0  # first open period; doubles on each consecutive trip
+BREAKER_MAX_COOLDOWN = 15 * 60.0
+DETAILS_TIMEOUT = 30  # seconds per extraction attempt
+THUMBNAIL_TIMEOUT = 15
+CANCEL_POLL_INTERVAL = 0.1
+PREFETCH_WORKERS = 8  # concurrent metadata extractions for batch imports
+JOURNAL_PATH = os.path.join(APP_DATA_DIR, "journal.sqlite3")
+OUTPUT_LINK_METHODS = ('reflink', 'hardlink', 'copy')  # tried in order when reusing a finished download
+DUPLICATE_RECHECK_DELAY = 2.0  # seconds a job waits while an identical one is downloading
+OUTPUT_TEMPLATE = '%(title)s%(y2_suffix|)s.%(ext)s'  # y2_suffix is ' [<id>]' when the title is already taken
+JOURNAL_RETENTION = 7 * 24 * 60 * 60
+JOURNAL_VACUUM_FREE_RATIO = 0.25  # startup compaction only rewrites the file once this share of it is free pages
+JOURNAL_VACUUM_MIN_FREE = 1024 * 1024  # ... and at least this many bytes would be reclaimed
+THROUGHPUT_WINDOW = 5.0  # seconds of progress history used for speed and ETA
+BANDWIDTH_BURST = 1.0  # seconds of traffic a download may send ahead of the limit
+BANDWIDTH_IDLE_AFTER = 1.0  # a download that has not reported bytes for this long gives up its share
+FFMPEG_LOCATION_CACHE = os.path.join(APP_DATA_DIR, "ffmpeg_location.json")
+LOG_PATH = os.path.join(APP_DATA_DIR, "logs", "debug.log")
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+DEFAULT_DOWNLOAD_SEGMENTS = 4  # parallel connections per file (HTTP ranges or DASH/HLS fragments)
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024  # smaller files are not worth splitting
+SEGMENT_READ_SIZE = 256 * 1024
+SEGMENT_RETRIES = 5
+SEGMENT_RETRY_BASE_DELAY = 0.5
+SEGMENT_MARKER_INTERVAL = 1.0  # seconds between saves of per-range progress to the .segments file
+TRANSCODE_WORKERS = os.cpu_count() or 2
+MP3_BITRATE = '192k'
+METRICS_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+STATS_FILE_INTERVAL = 10.0
+
+# --- Path and Environment Setup ---
+def get_ffmpeg_path():
+    """ Find the path to ffmpeg executable. """
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+        ffmpeg_path = os.path.join(base_path, 'ffmpeg.exe')
+        if os.path.exists(ffmpeg_path):
+            return ffmpeg_path
+    # Fallback to system ffmpeg
+    ffmpeg_path = shutil.which('ffmpeg')
+    if ffmpeg_path:
+        return ffmpeg_path
+    # Additional paths to check
+    possible_paths = [
+        '/usr/local/bin/ffmpeg',
+        '/usr/bin/ffmpeg',
+        os.path.join(os.path.expanduser('~'), 'ffmpeg', 'bin', 'ffmpeg.exe')
+    ]
+    for path in possible_paths:
+        if os.path.exists(path):
+            return path
+    return None
+
+_ffmpeg_lock = threading.Lock()
+_ffmpeg_resolved = False
+_ffmpeg_path = None
+
+def _read_cached_ffmpeg_path():
+    try:
+        with open(FFMPEG_LOCATION_CACHE, encoding='utf-8') as f:
+            path = json.load(f).get('path')
+    except (OSError, ValueError):
+        return None
+    return path if path and os.path.exists(path) else None
+
+def _write_cached_ffmpeg_path(path):
+    try:
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(FFMPEG_LOCATION_CACHE, 'w', encoding='utf-8') as f:
+            json.dump({'path': path}, f)
+    except OSError as e:
+        logging.warning(f"Could not cache ffmpeg location: {e}")
+
+def get_ffmpeg_location():
+    """ Return the ffmpeg path (or None), probing on first use only.
+
+    The result is cached in FFMPEG_LOCATION_CACHE between runs, except for the
+    copy bundled in a frozen build whose temp directory changes every launch.
+    """
+    global _ffmpeg_resolved, _ffmpeg_path
+    with _ffmpeg_lock:
+        if _ffmpeg_resolved:
+            return _ffmpeg_path
+        frozen = getattr(sys, 'frozen', False)
+        path = None if frozen else _read_cached_ffmpeg_path()
+        if path is None:
+            path = get_ffmpeg_path()
+            if path and not frozen:
+                _write_cached_ffmpeg_path(path)
+        if path:
+            ffmpeg_dir = os.path.dirname(path)
+            if ffmpeg_dir not in os.environ['PATH']:
+                os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ['PATH']
+        _ffmpeg_path = path
+        _ffmpeg_resolved = True
+        return path
+
+def warm_up():
+    """ Locate ffmpeg and build the first YoutubeDL sessions ahead of use. Meant for a background thread. """
+    started = time.perf_counter()
+    get_ffmpeg_location()
+    ydl_pool.prewarm('details')
+    ydl_pool.prewarm('download')
+    logging.info(f"Engine warm-up took {time.perf_counter() - started:.2f}s")
+
+# --- Logging ---
+class JsonLogFormatter(logging.Formatter):
+    """ One JSON object per line, including the task_id/url/phase/duration extras when given. """
+    EXTRA_FIELDS = ('task_id', 'url', 'phase', 'duration', 'timings', 'retries')
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+def setup_logging(path=LOG_PATH, level=None, json_format=None, stream=None,
+                  max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_when=None):
+    """ Send all logging through a queue to a background writer thread.
+
+    Callers only pay for putting the record on the queue; formatting and file
+    I/O happen on the QueueListener thread. The file rotates by size, or by
+    time when rotate_when is given (e.g. 'midnight'). level and json_format
+    default to the Y2_LOG_LEVEL and Y2_LOG_JSON environment variables.
+    Returns the listener; it is stopped (and flushed) at exit.
+    """
+    level = (level or os.environ.get('Y2_LOG_LEVEL') or 'INFO').upper()
+    if json_format is None:
+        json_format = os.environ.get('Y2_LOG_JSON', '') not in ('', '0')
+    formatter = JsonLogFormatter() if json_format else logging.Formatter(LOG_FORMAT)
+    handlers = []
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if rotate_when:
+            handler = logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count, encoding='utf-8', delay=True)
+        else:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        handlers.append(handler)
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    # PIL logs every image plugin it imports at DEBUG level.
+    logging.getLogger('PIL').setLevel(max(root.level, logging.INFO))
+    return listener
+
+# --- Metrics ---
+def classify_error(error):
+    """ Short, low-cardinality name for an exception, e.g. 'HTTPError 403' or 'TimeoutError'.
+
+    Walks the same wrapped-error chain as classify_failure: the first error
+    with an HTTP status wins, otherwise the innermost error names the class.
+    """
+    chain = _error_chain(error) or [error]
+    for cause in chain:
+        status = getattr(cause, 'status', None) or getattr(cause, 'code', None)
+        if isinstance(status, int):
+            return f"{type(cause).__name__} {status}"
+    return type(chain[-1]).__name__
+
+class MetricsRegistry:
+    """ Thread-safe counters and histograms, exportable as Prometheus text or a JSON snapshot. """
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        """ JSON-serialisable copy of every metric. """
+        with self._lock:
+            counters = [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in self._counters.items()]
+            histograms = [{'name': n, 'labels': dict(l), 'buckets': dict(zip(map(str, self.buckets), h['buckets'])),
+                           'sum': h['sum'], 'count': h['count']} for (n, l), h in self._histograms.items()]
+        return {'time': time.time(), 'counters': counters, 'histograms': histograms}
+
+    def prometheus_text(self):
+        def escape(value):
+            # Label values are double-quoted strings in the exposition format.
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, dict(h, buckets=list(h['buckets']))) for k, h in self._histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+metrics.describe('y2_phase_seconds', "Time spent per task phase (queue_wait, extract, thumbnail, transfer, postprocess)")
+metrics.describe('y2_jobs_total', "Finished download jobs by outcome")
+metrics.describe('y2_bytes_total', "Bytes transferred by download jobs")
+metrics.describe('y2_retries_total', "Retried attempts by phase")
+metrics.describe('y2_errors_total', "Errors by phase and error class")
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """ Serve /metrics (Prometheus text) and /stats.json from a daemon thread. """
+    import http.server
+
+    class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] == '/metrics':
+                body, content_type = metrics.prometheus_text().encode('utf-8'), 'text/plain; version=0.0.4'
+            elif self.path.split('?')[0] == '/stats.json':
+                body, content_type = json.dumps(metrics.snapshot()).encode('utf-8'), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logging.info(f"Metrics available at http://{host}:{server.server_port}/metrics")
+    return server
+
+def start_stats_file_writer(path, interval=STATS_FILE_INTERVAL):
+    """ Periodically replace path with the JSON metrics snapshot. Returns a stop() that writes a final one. """
+    stop_event = threading.Event()
+
+    def write_loop():
+        while True:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(metrics.snapshot(), f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logging.warning(f"Could not write stats file {path}: {e}")
+            if stop_event.is_set():
+                return
+            stop_event.wait(interval)
+
+    thread = threading.Thread(target=write_loop, name='stats-file-writer', daemon=True)
+    thread.start()
+
+    def stop():
+        stop_event.set()
+        thread.join(timeout=5)
+    return stop
+
+# --- Segmented Downloads ---
+def plan_segments(total_size, segments, min_segment_size=MIN_SEGMENT_SIZE):
+    """ Split total_size bytes into at most segments (start, end) ranges, ends inclusive. """
+    count = max(1, min(segments, total_size // min_segment_size))
+    step = -(-total_size // count)
+    return [(start, min(start + step, total_size) - 1) for start in range(0, total_size, step)]
+
+def expected_digest(headers):
+    """ (hashlib name, hex digest) of the whole file from Repr-Digest or Digest headers, or None. """
+    for header in ('Repr-Digest', 'Digest'):
+        for item in (headers.get(header) or '').split(','):
+            algorithm, _, encoded = item.strip().partition('=')
+            name = {'sha-256': 'sha256', 'sha-512': 'sha512', 'md5': 'md5'}.get(algorithm.lower())
+            if name and encoded:
+                try:
+                    return name, base64.b64decode(encoded.strip(':'), validate=True).hex()
+                except ValueError:
+                    continue
+    return None
+
+def _file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_engine_ydl_class = None
+
+def engine_ydl_class():
+    """ YoutubeDL subclass that sends large progressive HTTP downloads through SegmentedHttpFD. """
+    global _engine_ydl_class
+    if _engine_ydl_class is not None:
+        return _engine_ydl_class
+    import yt_dlp
+    from yt_dlp.downloader.common import FileDownloader
+    from yt_dlp.networking import Request
+    from yt_dlp.networking.exceptions import HTTPError, RequestError
+    from yt_dlp.utils import determine_protocol
+
+    class SegmentedHttpFD(FileDownloader):
+        """ Fetches one file over several Range requests written in place into a preallocated .part file.
+
+        Each segment retries on its own and resumes from its last written byte.
+        When an http_chunk_size is set (yt-dlp's YouTube extractor sets one,
+        since YouTube throttles larger ranges), a segment is fetched as a run of
+        requests of at most that size, as yt-dlp's own HttpFD does. Progress from all segments is summed into one stream of hook calls, and
+        the finished file is checked against the probed size and, when the
+        server publishes one, its Repr-Digest/Digest checksum.
+
+        How far each range got is saved as JSON in a .segments file next to
+        the .part, so a failed, cancelled or crashed download resumes the
+        unfinished ranges on its next attempt. Both are only discarded here
+        when the data turns out to be corrupt.
+        """
+        FD_NAME = 'segmented'
+
+        @staticmethod
+        def load_marker(marker, tmpfilename, total_size):
+            """ Saved [start, end, position] ranges if they match this .part, otherwise None. """
+            try:
+                with open(marker, encoding='utf-8') as f:
+                    saved = json.load(f)
+                plan = [[int(start), int(end), int(position)] for start, end, position in saved['ranges']]
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+            if saved.get('total_size') != total_size or not os.path.exists(tmpfilename) or os.path.getsize(tmpfilename) != total_size:
+                return None
+            if not all(start <= position <= end + 1 for start, end, position in plan):
+                return None
+            return plan
+
+        @staticmethod
+        def save_marker(marker, total_size, plan):
+            try:
+                with open(marker + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump({'total_size': total_size, 'ranges': [list(segment) for segment in plan]}, f)
+                os.replace(marker + '.tmp', marker)
+            except OSError as e:
+                logging.warning(f"Could not save segment progress to {marker}: {e}")
+
+        def probe(self, info_dict):
+            """ Return (total_size, digest) if the server honours byte ranges, otherwise None. """
+            request = Request(info_dict['url'], headers=dict(info_dict.get('http_headers') or {}, Range='bytes=0-0'))
+            try:
+                with self.ydl.urlopen(request) as response:
+                    response.read()
+                    match = re.match(r'bytes 0-0/(\d+)$', response.headers.get('Content-Range', ''))
+                    if response.status != 206 or not match:
+                        return None
+                    return int(match.group(1)), expected_digest(response.headers)
+            except RequestError as e:
+                logging.info(f"Range probe failed for {info_dict.get('id')}, using a single connection: {e}")
+                return None
+
+        def real_download(self, filename, info_dict):
+            total_size, digest, ranges = self.total_size, self.digest, self.ranges
+            tmpfilename = self.temp_name(filename)
+            marker = tmpfilename + '.segments'
+            headers = info_dict.get('http_headers') or {}
+            retries = self.params.get('fragment_retries', SEGMENT_RETRIES)
+            chunk_size = self.params.get('http_chunk_size') or (info_dict.get('downloader_options') or {}).get('http_chunk_size')
+            progress_lock = threading.Lock()
+            stop = threading.Event()
+            started = time.time()
+
+            self.report_destination(filename)
+            plan = self.load_marker(marker, tmpfilename, total_size)
+            if plan is None:
+                plan = [[start, end, start] for start, end in ranges]
+                with open(tmpfilename, 'wb') as f:
+                    f.truncate(total_size)
+            else:
+                logging.info(f"Resuming segmented download of {filename}")
+            # The marker also tells a later run that this .part has holes and cannot be resumed linearly.
+            self.save_marker(marker, total_size, plan)
+            state = {'downloaded': sum(position - start for start, _, position in plan), 'saved_at': time.monotonic()}
+
+            def report(count):
+                # One lock for counting and reporting keeps downloaded_bytes monotonic across segments.
+                with progress_lock:
+                    state['downloaded'] += count
+                    downloaded = state['downloaded']
+                    if time.monotonic() - state['saved_at'] >= SEGMENT_MARKER_INTERVAL:
+                        state['saved_at'] = time.monotonic()
+                        self.save_marker(marker, total_size, plan)
+                    now = time.time()
+                    self._hook_progress({
+                        'status': 'downloading',
+                        'downloaded_bytes': downloaded,
+                        'total_bytes': total_size,
+                        'tmpfilename': tmpfilename,
+                        'filename': filename,
+                        'elapsed': now - started,
+                        'speed': self.calc_speed(started, now, downloaded),
+                        'eta': self.calc_eta(started, now, total_size, downloaded),
+                    }, info_dict)
+
+            def fetch(segment):
+                start, end, position = segment
+                attempt = 0
+                # Unbuffered, so a position saved in the marker is never ahead of the bytes in the file.
+                with open(tmpfilename, 'r+b', buffering=0) as out:
+                    while position <= end and not stop.is_set():
+                        request_end = min(position + chunk_size - 1, end) if chunk_size else end
+                        try:
+                            request = Request(info_dict['url'], headers=dict(headers, Range=f'bytes={position}-{request_end}'))
+                            with self.ydl.urlopen(request) as response:
+                                if response.status != 206 or not response.headers.get('Content-Range', '').startswith(f'bytes {position}-'):
+                                    raise RequestError(f"server ignored range {position}-{request_end}")
+                                out.seek(position)
+                                while position <= request_end and not stop.is_set():
+                                    chunk = response.read(min(SEGMENT_READ_SIZE, request_end - position + 1))
+                                    if not chunk:
+                                        break
+                                    out.write(chunk)
+                                    position += len(chunk)
+                                    segment[2] = position
+                                    report(len(chunk))
+                            if position <= request_end and not stop.is_set():
+                                raise RequestError(f"segment {start}-{end} ended early at byte {position}")
+                        except RequestError as e:
+                            kind, _ = classify_failure(e)
+                            if kind == 'fatal' and not isinstance(e, HTTPError):
+                                kind = 'transient'  # short reads and ignored ranges are worth another try
+                            attempt += 1
+                            if kind != 'transient' or attempt > retries:
+                                raise  # throttling is left to the job, which backs off and trips the host breaker
+                            metrics.inc('y2_retries_total', phase='segment')
+                            logging.warning(f"Segment {start}-{end} of {filename} failed ({e}), retry {attempt}/{retries}")
+                            stop.wait(SEGMENT_RETRY_POLICY.delay(attempt))
+
+            report(0)  # announces tmpfilename (and any resumed bytes) to the progress hooks
+            corrupt = False
+            try:
+                pending = [segment for segment in plan if segment[2] <= segment[1]]
+                if pending:
+                    with ThreadPoolExecutor(len(pending), thread_name_prefix='segment') as executor:
+                        futures = [executor.submit(fetch, segment) for segment in pending]
+                        try:
+                            for future in as_completed(futures):
+                                future.result()
+                        except BaseException:
+                            stop.set()
+                            raise
+                corrupt = True
+                if os.path.getsize(tmpfilename) != total_size or state['downloaded'] != total_size:
+                    raise RequestError(f"size mismatch: got {state['downloaded']} of {total_size} bytes")
+                if digest and _file_digest(tmpfilename, digest[0]) != digest[1]:
+                    raise RequestError(f"{digest[0]} checksum mismatch")
+            except BaseException as e:
+                if corrupt:
+                    self.try_remove(tmpfilename)
+                    self.try_remove(marker)
+                else:
+                    self.save_marker(marker, total_size, plan)  # the next attempt resumes from here
+                if not isinstance(e, RequestError):
+                    raise
+                self.report_error(f"Segmented download of {filename} failed: {e}")
+                return False
+            self.try_remove(marker)
+            self.try_rename(tmpfilename, filename)
+            self._hook_progress({
+                'status': 'finished',
+                'downloaded_bytes': total_size,
+                'total_bytes': total_size,
+                'filename': filename,
+                'elapsed': time.time() - started,
+            }, info_dict)
+            return True
+
+    class EngineYoutubeDL(yt_dlp.YoutubeDL):
+        def pre_process(self, ie_info, key='pre_process', files_to_move=None):
+            info, files_to_move = super().pre_process(ie_info, key, files_to_move)
+            output_hook = self.params.get('y2_output_hook')
+            if key == 'video' and output_hook is not None:
+                # Runs after format selection, right before the output filename is chosen.
+                output_hook(info, self)
+            return info, files_to_move
+
+        def dl(self, name, info, subtitle=False, test=False):
+            segments = self.params.get('y2_segments') or 1
+            if (not test and not subtitle and name != '-' and info.get('url')
+                    and determine_protocol(info) in ('http', 'https') and not info.get('fragments')):
+                fd = SegmentedHttpFD(self, self.params)
+                tmpfilename = fd.temp_name(name)
+                # A .segments file means the .part was written by range and can only be resumed that way.
+                segmented_part = os.path.exists(tmpfilename + '.segments')
+                if segmented_part or (segments > 1 and not os.path.exists(tmpfilename)):
+                    new_info = self._copy_infodict(info)
+                    if new_info.get('http_headers') is None:
+                        new_info['http_headers'] = self._calc_headers(new_info)
+                    probe = fd.probe(new_info)
+                    if probe and (segmented_part or probe[0] >= 2 * MIN_SEGMENT_SIZE):
+                        fd.total_size, fd.digest = probe
+                        fd.ranges = plan_segments(fd.total_size, segments)
+                        for hook in self._progress_hooks:
+                            fd.add_progress_hook(hook)
+                        return fd.download(name, new_info, subtitle)
+                    if segmented_part:
+                        # Ranges are no longer available; the .part has holes, so start over.
+                        fd.try_remove(tmpfilename)
+                        fd.try_remove(tmpfilename + '.segments')
+            return super().dl(name, info, subtitle, test)
+
+    _engine_ydl_class = EngineYoutubeDL
+    return _engine_ydl_class
+
+# --- YoutubeDL Session Pool ---
+def _base_ydl_options():
+    return {'quiet': True, 'noprogress': True, 'user_agent': USER_AGENT, 'socket_timeout': 15}
+
+def _details_ydl_options():
+    return dict(_base_ydl_options(), skip_download=True, cachedir=False, skip_update=True, nocheckcertificate=True)
+
+def _download_ydl_options():
+    return dict(_base_ydl_options(), ffmpeg_location=get_ffmpeg_location(), postprocessors=[],
+                continuedl=True)  # pick up .part files left by an interrupted run
+
+# Option profiles shared by every session; per-task settings are applied by YoutubeDLSession.configure.
+YDL_PROFILES = {
+    'details': _details_ydl_options,
+    'details_flat': lambda: dict(_details_ydl_options(), extract_flat=True),
+    'playlist': lambda: dict(_base_ydl_options(), extract_flat=True, lazy_playlist=True),
+    'download': _download_ydl_options,
+}
+
+# Extractor classes tried before yt-dlp's built-ins (which end in a catch-all Generic extractor).
+EXTRA_EXTRACTORS = []
+
+def register_extractor(ie_class):
+    """ Make ie_class available to YoutubeDL sessions created from now on. """
+    if ie_class not in EXTRA_EXTRACTORS:
+        EXTRA_EXTRACTORS.append(ie_class)
+    return ie_class
+
+class YoutubeDLSession:
+    """ A long-lived YoutubeDL for one profile, re-targeted for each task.
+
+    Extractors, the HTTP handlers and cookie jar are set up once. Format,
+    output template, playlist flag and hooks are swapped per task; compiled
+    format selectors are cached so switching formats stays cheap.
+    """
+    def __init__(self, profile):
+        self.profile = profile
+        self.ydl = engine_ydl_class()(YDL_PROFILES[profile](), auto_init=not EXTRA_EXTRACTORS)
+        if EXTRA_EXTRACTORS:
+            for ie_class in EXTRA_EXTRACTORS:
+                self.ydl.add_info_extractor(ie_class())
+            self.ydl.add_default_info_extractors()
+        self.ydl.add_progress_hook(self._dispatch_progress)
+        self.ydl.add_post_hook(self._dispatch_post)
+        self.ydl.add_postprocessor_hook(self._dispatch_postprocessor)
+        self.progress_hook = None
+        self.post_hook = None
+        self.postprocessor_hook = None
+        self._selectors = {}
+
+    def _dispatch_progress(self, d):
+        if self.progress_hook is not None:
+            self.progress_hook(d)
+
+    def _dispatch_post(self, filepath):
+        if self.post_hook is not None:
+            self.post_hook(filepath)
+
+    def _dispatch_postprocessor(self, d):
+        if self.postprocessor_hook is not None:
+            self.postprocessor_hook(d)
+
+    def configure(self, format=None, outtmpl=None, noplaylist=None, segments=None, progress_hook=None, post_hook=None,
+                  postprocessor_hook=None, output_hook=None):
+        params = self.ydl.params
+        params['y2_output_hook'] = output_hook
+        if segments is not None:
+            params['y2_segments'] = segments
+            params['concurrent_fragment_downloads'] = segments
+        if format is not None and params.get('format') != format:
+            if format not in self._selectors:
+                self._selectors[format] = self.ydl.build_format_selector(format)
+            params['format'] = format
+            self.ydl.format_selector = self._selectors[format]
+        if outtmpl is not None:
+            params['outtmpl']['default'] = outtmpl
+        if noplaylist is not None:
+            params['noplaylist'] = noplaylist
+        self.progress_hook = progress_hook
+        self.post_hook = post_hook
+        self.postprocessor_hook = postprocessor_hook
+
+    def close(self):
+        self.ydl.close()
+
+class YoutubeDLPool:
+    """ Keeps idle YoutubeDLSessions per profile so each operation does not build a new YoutubeDL. """
+    def __init__(self, max_idle_per_profile=8):
+        self.max_idle_per_profile = max_idle_per_profile
+        self._lock = threading.Lock()
+        self._idle = {profile: [] for profile in YDL_PROFILES}
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def session(self, profile, **overrides):
+        """ Borrow a YoutubeDL for profile with per-task overrides (see YoutubeDLSession.configure). """
+        with self._lock:
+            idle = self._idle[profile]
+            session = idle.pop() if idle else None
+            if session is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if session is None:
+            session = YoutubeDLSession(profile)
+        session.configure(**overrides)
+        try:
+            yield session.ydl
+        finally:
+            session.configure()
+            with self._lock:
+                if len(self._idle[profile]) < self.max_idle_per_profile:
+                    self._idle[profile].append(session)
+                    session = None
+            if session is not None:
+                session.close()
+
+    def prewarm(self, profile, count=1):
+        """ Build idle sessions ahead of time, e.g. from a warm-up thread. """
+        sessions = [YoutubeDLSession(profile) for _ in range(count)]
+        with self._lock:
+            self.created += len(sessions)
+            self._idle[profile].extend(sessions)
+
+    def close(self):
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle]
+            for idle in self._idle.values():
+                idle.clear()
+        for session in sessions:
+            session.close()
+
+ydl_pool = YoutubeDLPool()
+
+# --- Progress Event Pipeline ---
+class ProgressChannel:
+    """ Thread-safe event channel between download workers and the UI (or CLI) loop.
+
+    Progress events ('downloading', 'converting') are coalesced so only the
+    latest state per task is pending at any time. Every other event (started, finished, error,
+    cancelled, done) is kept and delivered in order.
+
+    If wakeup is set, it is called from the putting thread whenever the
+    channel goes from empty to non-empty, so a consumer can sleep until there
+    is work; it must drain until empty() before waiting again.
+    """
+    COALESCED_STATUSES = frozenset({'downloading', 'converting'})
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = deque()
+        self._latest = {}
+        self.coalesced_count = 0
+        self.wakeup = None
+
+    def put(self, data):
+        task_id = data.get('task_id')
+        with self._lock:
+            was_empty = not self._events
+            if data.get('status') in self.COALESCED_STATUSES:
+                slot = self._latest.get(task_id)
+                if slot is not None:
+                    slot[0] = data
+                    self.coalesced_count += 1
+                    return
+                slot = [data]
+                self._latest[task_id] = slot
+                self._events.append(slot)
+            else:
+                # Progress reported after this event must not jump ahead of it.
+                self._latest.pop(task_id, None)
+                self._events.append([data])
+        wakeup = self.wakeup
+        if was_empty and wakeup is not None:
+            wakeup()
+
+    def drain(self, max_events=None):
+        """ Pop up to max_events pending events, oldest first. """
+        items = []
+        with self._lock:
+            while self._events and (max_events is None or len(items) < max_events):
+                slot = self._events.popleft()
+                data = slot[0]
+                if self._latest.get(data.get('task_id')) is slot:
+                    del self._latest[data.get('task_id')]
+                items.append(data)
+        return items
+
+    def empty(self):
+        with self._lock:
+            return not self._events
+
+class WakeupQueue(queue.Queue):
+    """ queue.Queue that calls wakeup() after every put, for consumers that sleep until there is work. """
+    def __init__(self, maxsize=0, wakeup=None):
+        super().__init__(maxsize)
+        self.wakeup = wakeup
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        wakeup = self.wakeup
+        if wakeup is not None:
+            wakeup()
+
+# --- Metadata Cache ---
+def canonical_media_key(url, flat=False):
+    """ Return 'video:<id>' or 'playlist:<id>' for a YouTube URL, or None if unrecognised. """
+    parsed = urlparse(url if '://' in url else 'https://' + url)
+    query = parse_qs(parsed.query)
+    if flat and query.get('list'):
+        return f"playlist:{query['list'][0]}"
+    video_id = None
+    if parsed.netloc.endswith('youtu.be'):
+        video_id = parsed.path.lstrip('/').split('/')[0]
+    elif query.get('v'):
+        video_id = query['v'][0]
+    else:
+        match = re.match(r'^/(?:embed|v|shorts|live)/([^/?&]{11})', parsed.path)
+        if match:
+            video_id = match.group(1)
+    if video_id:
+        return f"video:{video_id}"
+    if query.get('list'):
+        return f"playlist:{query['list'][0]}"
+    return None
+
+class MetadataCache:
+    """ On-disk SQLite cache of extract_info results keyed by canonical video/playlist ID.
+
+    Entries that carry stream URLs expire after FORMAT_URL_TTL, everything else
+    after METADATA_CACHE_TTL. When the stored payload exceeds max_bytes the least
+    recently used entries are evicted.
+    """
+    def __init__(self, path=METADATA_CACHE_PATH, max_bytes=METADATA_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS info ("
+                "key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS info_last_access ON info (last_access)")
+        return self._conn
+
+    def get(self, key):
+        if key is None:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT payload, expires_at FROM info WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                payload, expires_at = row
+                if expires_at < time.time():
+                    conn.execute("DELETE FROM info WHERE key = ?", (key,))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE info SET last_access = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+            return json.loads(zlib.decompress(payload))
+        except (sqlite3.Error, zlib.error, ValueError) as e:
+            logging.warning(f"Metadata cache read failed for {key}: {e}")
+            return None
+
+    def put(self, key, info_dict):
+        if key is None or not info_dict:
+            return
+        ttl = FORMAT_URL_TTL if info_dict.get('formats') else METADATA_CACHE_TTL
+        try:
+            payload = zlib.compress(json.dumps(info_dict).encode('utf-8'))
+            now = time.time()
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO info (key, payload, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now + ttl, now),
+                )
+                self._evict(conn)
+                conn.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logging.warning(f"Metadata cache write failed for {key}: {e}")
+
+    def invalidate(self, key):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute("DELETE FROM info WHERE key = ?", (key,))
+                conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Metadata cache invalidate failed for {key}: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM info WHERE expires_at < ?", (time.time(),))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+        for key, size in conn.execute("SELECT key, size FROM info ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM info WHERE key = ?", (key,))
+            total -= size
+
+def extract_info_cached(url, profile='details', refresh=False, token=None):
+    """ extract_info through metadata_cache; refresh=True skips the lookup but still stores the result.
+
+    With a token, the wait ends with TimeoutError or OperationCancelled as
+    soon as the token expires, even if the extraction itself is stuck.
+    """
+    flat = profile != 'details'
+    key = canonical_media_key(url, flat=flat)
+    if key and flat:
+        key += ':flat'
+    if not refresh:
+        info_dict = metadata_cache.get(key)
+        if info_dict is not None:
+            logging.info(f"Metadata cache hit for {key}")
+            return info_dict
+
+    def extract():
+        with ydl_pool.session(profile) as ydl:
+            info_dict = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        metadata_cache.put(key, info_dict)
+        return info_dict
+
+    # Concurrent lookups of the same video share one extraction.
+    return extraction_flight.do(key or f"{profile}:{url}", extract, token)
+
+class SingleFlight:
+    """ Collapses concurrent calls with the same key into one; every caller gets its result or exception.
+
+    A caller with a token stops waiting once it expires. If that caller was
+    running the call, the call is given up on: its key is released at once,
+    so the next caller starts a fresh one instead of joining a stuck call,
+    and callers already waiting get the same TimeoutError or
+    OperationCancelled and may retry.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn, token=None):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+        if not leader:
+            if token is not None:
+                while not futures_wait([future], CANCEL_POLL_INTERVAL).done:
+                    token.raise_if_cancelled()
+            return future.result()
+        try:
+            result = fn() if token is None else call_with_token(token, fn)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+metadata_cache = MetadataCache()
+extraction_flight = SingleFlight()
+
+# --- Playlist Expansion ---
+class PlaylistExpansion:
+    """ Streams the entries of a playlist from a background thread.
+
+    Reuses an already-loaded flat playlist info dict when one is available,
+    otherwise asks yt-dlp for a lazy (process=False) playlist result and walks
+    its entries page by page. Entries are handed out in batches so the caller
+    can queue downloads as they arrive.
+    """
+    def __init__(self, url, folder, quality_format, playlist_info=None, batch_size=PLAYLIST_EXPANSION_BATCH_SIZE):
+        self.url = url
+        self.folder = folder
+        self.quality_format = quality_format
+        self.playlist_info = playlist_info
+        self.batch_size = batch_size
+        self.cancel_event = threading.Event()
+        self.expanded = 0
+        self.total = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def iter_entries(self):
+        if self.playlist_info is not None and self.playlist_info.get('entries') is not None:
+            entries = self.playlist_info['entries']
+            self.total = len(entries)
+            yield from entries
+            return
+        with ydl_pool.session('playlist') as ydl:
+            info = ydl.extract_info(self.url, download=False, process=False)
+            self.total = info.get('playlist_count')
+            entries = info.get('entries') or []
+            if isinstance(entries, list):
+                self.total = len(entries)
+            yield from entries
+
+    def iter_batches(self):
+        """ Yield lists of entries that have a downloadable URL until exhausted or cancelled. """
+        batch = []
+        for entry in self.iter_entries():
+            if self.cancelled:
+                return
+            if not entry or not (entry.get('url') or entry.get('webpage_url')):
+                continue
+            batch.append(entry)
+            self.expanded += 1
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch and not self.cancelled:
+            yield batch
+
+    def run(self, events):
+        """ Thread target: put batch/finished events for this expansion on the events queue. """
+        error_message = None
+        try:
+            for batch in self.iter_batches():
+                events.put({'expansion': self, 'entries': batch})
+        except Exception as e:
+            logging.error(f"Playlist expansion failed for {self.url}: {e}")
+            error_message = f"Could not expand playlist: {e}"
+        events.put({'expansion': self, 'finished': True, 'error_message': error_message})
+
+# --- Throughput Estimation ---
+def format_duration(seconds):
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class ThroughputEstimator:
+    """ Transfer rate over the last `window` seconds of progress samples, plus an ETA.
+
+    Unlike bytes / total elapsed time this ignores extraction time and recovers
+    quickly after stalls. A drop in the byte count (yt-dlp starting the audio
+    stream after the video one) resets the window.
+    """
+    def __init__(self, window=THROUGHPUT_WINDOW):
+        self.window = window
+        self._samples = deque()
+        self.rate = 0.0
+
+    def update(self, downloaded_bytes, now=None):
+        """ Add a sample and return the current rate in bytes per second. """
+        now = time.monotonic() if now is None else now
+        if self._samples and downloaded_bytes < self._samples[-1][1]:
+            self._samples.clear()
+        self._samples.append((now, downloaded_bytes))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+        first_time, first_bytes = self._samples[0]
+        if now > first_time:
+            self.rate = (downloaded_bytes - first_bytes) / (now - first_time)
+        return self.rate
+
+    def eta(self, remaining_bytes):
+        if remaining_bytes is None or self.rate <= 0:
+            return None
+        return max(0.0, remaining_bytes / self.rate)
+
+def aggregate_stats():
+    """ Bandwidth, counts and an overall ETA across everything in active_downloads. """
+    running, queued, paused = download_scheduler.counts()
+    jobs = list(active_downloads.values())
+    total_rate = sum(job.current_rate for job in jobs)
+    known_sizes = [job.total_bytes for job in jobs if job.total_bytes]
+    remaining = sum(job.remaining_bytes for job in jobs if job.remaining_bytes is not None)
+    # Jobs that have not reported a size yet are assumed to be average-sized.
+    unknown = sum(1 for job in jobs if job.remaining_bytes is None)
+    if known_sizes:
+        remaining += unknown * (sum(known_sizes) / len(known_sizes))
+    eta = remaining / total_rate if total_rate > 0 and known_sizes else None
+    return {
+        'rate': total_rate,
+        'running': running,
+        'queued': queued,
+        'paused': paused,
+        'remaining_bytes': remaining,
+        'eta': eta,
+        'throttled_hosts': {host: round(state['open_for'], 1) for host, state in host_breaker.snapshot().items() if state['open_for']},
+    }
+
+# --- Bandwidth Governor ---
+def parse_rate(text):
+    """ Parse '500K', '2M', '1.5MB/s' or a plain byte count into bytes per second; 0 means unlimited. """
+    text = str(text).strip().upper().replace('/S', '').rstrip('B').strip()
+    if text in ('', '0', 'UNLIMITED', 'NONE', 'OFF'):
+        return 0
+    multipliers = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    multiplier = multipliers.get(text[-1], 1)
+    if text[-1] in multipliers:
+        text = text[:-1]
+    return int(float(text) * multiplier)
+
+def _minutes_of_day(hhmm):
+    hours, minutes = hhmm.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+def parse_schedule(text):
+    """ Parse 'HH:MM-HH:MM=RATE,...' into [(start_minute, end_minute, bytes_per_sec)]. """
+    schedule = []
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        span, rate = part.split('=')
+        start, end = span.split('-')
+        schedule.append((_minutes_of_day(start), _minutes_of_day(end), parse_rate(rate)))
+    return schedule
+
+class BandwidthGovernor:
+    """ Process-wide rate limiter that every active download draws from.
+
+    Uses a virtual-time token bucket (GCRA) for the total cap and a second one
+    per download for its fair share, which is the cap divided by the number of
+    downloads that moved bytes within the last BANDWIDTH_IDLE_AFTER seconds.
+    A download that stalls or finishes drops out of that count, so its share is
+    redistributed and the aggregate stays close to the cap. Time-of-day
+    schedule entries override the base rate while they apply.
+    """
+    def __init__(self, rate=0, schedule=None, per_task_limit=0, burst=BANDWIDTH_BURST):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.schedule = list(schedule or [])
+        self.per_task_limit = per_task_limit
+        self.burst = burst
+        self._global_tat = 0.0
+        self._task_tat = {}
+        self._last_seen = {}
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = max(0, int(rate))
+
+    def set_schedule(self, schedule):
+        with self._lock:
+            self.schedule = list(schedule)
+
+    def current_rate(self, now=None):
+        """ The cap in effect right now, in bytes per second (0 = unlimited). """
+        local = time.localtime(now)
+        minute = local.tm_hour * 60 + local.tm_min
+        for start, end, rate in self.schedule:
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return rate
+        return self.rate
+
+    def _active_count(self, now):
+        for task_id, seen in list(self._last_seen.items()):
+            if now - seen > BANDWIDTH_IDLE_AFTER:
+                del self._last_seen[task_id]
+                self._task_tat.pop(task_id, None)
+        return max(1, len(self._last_seen))
+
+    def reserve(self, task_id, nbytes):
+        """ Account for nbytes sent by task_id and return how long it should now sleep. """
+        rate = self.current_rate()
+        with self._lock:
+            now = time.monotonic()
+            self._last_seen[task_id] = now
+            if rate <= 0 and not self.per_task_limit:
+                return 0.0
+            share = (rate / self._active_count(now)) if rate > 0 else self.per_task_limit
+            if self.per_task_limit:
+                share = min(share, self.per_task_limit)
+            wait = 0.0
+            if rate > 0:
+                self._global_tat = max(self._global_tat, now) + nbytes / rate
+                wait = self._global_tat - self.burst - now
+            task_tat = max(self._task_tat.get(task_id, 0.0), now) + nbytes / share
+            self._task_tat[task_id] = task_tat
+            return max(0.0, wait, task_tat - self.burst - now)
+
+    def release(self, task_id):
+        with self._lock:
+            self._last_seen.pop(task_id, None)
+            self._task_tat.pop(task_id, None)
+
+bandwidth_governor = BandwidthGovernor()
+
+# --- Job Journal ---
+class JobJournal:
+    """ Crash-safe record of every download job, stored in SQLite (WAL mode).
+
+    Each job is written when it is queued and again on every state change, so
+    after a crash or close the unfinished ones can be resumed. Completed
+    downloads are also kept in an archive table, mirrored in memory, which
+    serves as the index of finished outputs: every copy on disk is recorded
+    per (media key, format, folder) with its size, so a repeat request is
+    skipped, or satisfied from a copy in another folder, without the network.
+    The media key is canonical_media_key(url) ('video:<id>' for YouTube), or
+    the URL itself for other sites.
+    """
+    UNFINISHED_STATES = ('queued', 'running')
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._archive = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "journal_id TEXT PRIMARY KEY, url TEXT NOT NULL, folder TEXT NOT NULL, "
+                "quality_format TEXT NOT NULL, is_playlist INTEGER NOT NULL, title TEXT, "
+                "state TEXT NOT NULL, filepath TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS archive ("
+                "media_key TEXT NOT NULL, quality_format TEXT NOT NULL, folder TEXT NOT NULL, "
+                "filepath TEXT NOT NULL, completed_at REAL NOT NULL, size INTEGER, "
+                "PRIMARY KEY (media_key, quality_format, folder))"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(archive)")}
+            if 'size' not in columns:  # archives written before sizes were recorded
+                self._conn.execute("ALTER TABLE archive ADD COLUMN size INTEGER")
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute(sql, params)
+                conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Journal write failed: {e}")
+
+    def record(self, job, state):
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (journal_id, url, folder, quality_format, is_playlist, title, state, filepath, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(journal_id) DO UPDATE SET state = excluded.state, "
+            "filepath = COALESCE(excluded.filepath, jobs.filepath), updated_at = excluded.updated_at",
+            (job.journal_id, job.url, job.folder, job.quality_format, int(job.is_playlist),
+             job.info_dict.get('title'), state, job.filepath, now, now),
+        )
+
+    def unfinished(self):
+        """ Return jobs that were queued or running when the app last stopped, oldest first. """
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT journal_id, url, folder, quality_format, is_playlist, title FROM jobs "
+                    "WHERE state IN (?, ?) ORDER BY created_at", self.UNFINISHED_STATES,
+                ).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Journal read failed: {e}")
+            return []
+        keys = ('journal_id', 'url', 'folder', 'quality_format', 'is_playlist', 'title')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def abandon_unfinished(self):
+        self._execute("UPDATE jobs SET state = 'abandoned', updated_at = ? WHERE state IN (?, ?)",
+                      (time.time(),) + self.UNFINISHED_STATES)
+
+    def abandon(self, journal_id):
+        self._execute("UPDATE jobs SET state = 'abandoned', updated_at = ? WHERE journal_id = ?", (time.time(), journal_id))
+
+    @staticmethod
+    def _folder_key(folder):
+        return os.path.normcase(os.path.abspath(folder))
+
+    def _load_archive(self):
+        # (media_key, quality_format) -> {folder key: (filepath, size)}
+        if self._archive is None:
+            # Built aside and published under the lock, so no thread ever sees a half-loaded archive.
+            archive = {}
+            try:
+                with self._lock:
+                    if self._archive is not None:
+                        return self._archive
+                    rows = self._connect().execute("SELECT media_key, quality_format, folder, filepath, size FROM archive").fetchall()
+                    for media_key, quality_format, folder, filepath, size in rows:
+                        archive.setdefault((media_key, quality_format), {})[folder] = (filepath, size)
+                    self._archive = archive
+            except sqlite3.Error as e:
+                logging.warning(f"Journal archive read failed: {e}")
+                return archive
+        return self._archive
+
+    @staticmethod
+    def _valid(filepath, size):
+        if size is None:  # archived before sizes were recorded
+            return os.path.exists(filepath)
+        try:
+            return os.path.getsize(filepath) == size
+        except OSError:
+            return False
+
+    def lookup(self, url, quality_format, folder, elsewhere=True):
+        """ Return an archived copy that still exists with its recorded size, preferring one in folder.
+
+        With elsewhere=False only a copy in folder itself counts. Entries whose
+        file went missing or changed are dropped on the way.
+        """
+        key = OutputStore.key(url, quality_format)
+        folder = self._folder_key(folder)
+        copies = self._load_archive().get(key, {})
+        candidates = sorted(copies.items(), key=lambda item: item[0] != folder)
+        for copy_folder, (filepath, size) in candidates:
+            if copy_folder != folder and not elsewhere:
+                continue
+            if self._valid(filepath, size):
+                return filepath
+            self._forget(key, copy_folder)
+        return None
+
+    def _forget(self, key, folder):
+        self._load_archive().get(key, {}).pop(folder, None)
+        self._execute("DELETE FROM archive WHERE media_key = ? AND quality_format = ? AND folder = ?", key + (folder,))
+
+    def add_to_archive(self, url, quality_format, folder, filepath):
+        try:
+            size = os.path.getsize(filepath)
+        except OSError as e:
+            logging.warning(f"Not archiving {filepath}: {e}")
+            return
+        key = OutputStore.key(url, quality_format)
+        folder = self._folder_key(folder)
+        self._load_archive().setdefault(key, {})[folder] = (filepath, size)
+        self._execute("INSERT OR REPLACE INTO archive (media_key, quality_format, folder, filepath, completed_at, size) VALUES (?, ?, ?, ?, ?, ?)",
+                      key + (folder, filepath, time.time(), size))
+
+    def verify(self, repair=False):
+        """ Check every archived file still exists with its recorded size.
+
+        Returns {'checked', 'valid', 'missing', 'changed', 'removed'}; with
+        repair=True stale entries are dropped from the archive.
+        """
+        report = {'checked': 0, 'valid': 0, 'missing': 0, 'changed': 0, 'removed': 0}
+        stale = []
+        for key, copies in list(self._load_archive().items()):
+            for folder, (filepath, size) in list(copies.items()):
+                report['checked'] += 1
+                if self._valid(filepath, size):
+                    report['valid'] += 1
+                    continue
+                report['missing' if not os.path.exists(filepath) else 'changed'] += 1
+                stale.append((key, folder))
+        if repair:
+            for key, folder in stale:
+                self._forget(key, folder)
+            report['removed'] = len(stale)
+        return report
+
+    def compact(self, retention=JOURNAL_RETENTION, force=False):
+        """ Drop finished job rows older than retention and reclaim the space.
+
+        VACUUM rewrites the whole file, so unless force is set it only runs
+        once enough of the file is free pages to be worth it.
+        """
+        self._execute("DELETE FROM jobs WHERE state NOT IN (?, ?) AND updated_at < ?",
+                      self.UNFINISHED_STATES + (time.time() - retention,))
+        try:
+            with self._lock:
+                conn = self._connect()
+                if not force:
+                    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+                    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+                    if (not page_count or free_pages / page_count < JOURNAL_VACUUM_FREE_RATIO
+                            or free_pages * page_size < JOURNAL_VACUUM_MIN_FREE):
+                        return
+                conn.execute("VACUUM")
+        except sqlite3.Error as e:
+            logging.warning(f"Journal compaction failed: {e}")
+
+job_journal = JobJournal()
+
+# --- Output Store ---
+FICLONE = 0x40049409  # Linux ioctl behind `cp --reflink` (btrfs, XFS, bcachefs, ...)
+
+def _reflink(source, target):
+    if not sys.platform.startswith('linux'):
+        raise OSError(f"reflinks are not supported on {sys.platform}")
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+def link_or_copy(source, target, methods=OUTPUT_LINK_METHODS):
+    """ Create target with the contents of source as cheaply as the filesystem allows; returns the method used.
+
+    A reflink is an instant copy-on-write clone, a hardlink shares the file
+    (both need the same filesystem) and a copy always works but takes time.
+    """
+    error = None
+    for method in methods:
+        try:
+            if method == 'reflink':
+                _reflink(source, target)
+            elif method == 'hardlink':
+                os.link(source, target)
+            else:
+                shutil.copy2(source, target)
+            return method
+        except OSError as e:
+            error = e
+    raise error
+
+class OutputStore:
+    """ Keeps concurrent jobs apart on disk; the finished outputs themselves are indexed by job_journal.
+
+    It tracks the output paths running jobs have claimed and which
+    (media key, format) pairs are being downloaded, so concurrent jobs never
+    write to the same filename and the same video is not fetched twice at
+    once. A finished copy found in another folder is brought over with
+    link_or_copy.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claims = {}  # normcased path -> task_id of the job writing it
+        self._in_flight = {}  # (media_key, quality_format) -> task_id of the job downloading it
+
+    @staticmethod
+    def key(url, quality_format):
+        return (canonical_media_key(url) or url, quality_format)
+
+    @staticmethod
+    def tag(url):
+        """ Short, stable name fragment for url that tells same-titled videos apart. """
+        media_key = canonical_media_key(url)
+        if media_key:
+            return media_key.split(':', 1)[1]
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+
+    def materialize(self, source, folder, tag, owner):
+        """ Make source available in folder; returns (path, method), method None if it is already there. """
+        if os.path.normcase(os.path.dirname(os.path.abspath(source))) == os.path.normcase(os.path.abspath(folder)):
+            return source, None
+        suffix = self.claim([os.path.join(folder, os.path.basename(source))], tag, owner)
+        stem, ext = os.path.splitext(os.path.basename(source))
+        target = os.path.join(folder, stem + suffix + ext)
+        return target, link_or_copy(source, target)
+
+    def claim(self, paths, tag, owner):
+        """ Reserve output names for owner; returns the suffix ('', ' [tag]', ' [tag] (2)', ...) to insert before the extension.
+
+        A name is taken if any of paths exists on disk or was claimed by another job.
+        """
+        def available(path):
+            holder = self._claims.get(path)
+            return holder == owner.task_id if holder is not None else not os.path.exists(path)
+
+        with self._lock:
+            for n in itertools.count(1):
+                suffix = '' if n == 1 else f" [{tag}]" if n == 2 else f" [{tag}] ({n - 1})"
+                candidates = [os.path.normcase(os.path.abspath(stem + suffix + ext)) for stem, ext in map(os.path.splitext, paths)]
+                if all(available(path) for path in candidates):
+                    for path in candidates:
+                        self._claims[path] = owner.task_id
+                    return suffix
+
+    def adopt(self, path, size, owner):
+        """ Claim path for owner if it is an unclaimed file of exactly size bytes, i.e. this download already done. """
+        path = os.path.normcase(os.path.abspath(path))
+        with self._lock:
+            if path in self._claims:
+                return self._claims[path] == owner.task_id
+            try:
+                if os.path.getsize(path) != size:
+                    return False
+            except OSError:
+                return False
+            self._claims[path] = owner.task_id
+            return True
+
+    def begin(self, owner):
+        """ Mark owner as downloading its key; returns False while another job is downloading the same one. """
+        key = self.key(owner.url, owner.quality_format)
+        with self._lock:
+            holder = self._in_flight.setdefault(key, owner.task_id)
+        return holder == owner.task_id
+
+    def finish(self, owner):
+        """ Drop owner's claims and in-flight mark once the job has ended. """
+        with self._lock:
+            self._claims = {path: task_id for path, task_id in self._claims.items() if task_id != owner.task_id}
+            key = self.key(owner.url, owner.quality_format)
+            if self._in_flight.get(key) == owner.task_id:
+                del self._in_flight[key]
+
+output_store = OutputStore()
+
+# --- Global Variables ---
+download_queue = ProgressChannel()
+active_downloads = {}
+
+# --- Cancellation ---
+class OperationCancelled(Exception):
+    pass
+
+class CancelToken:
+    """ Cross-platform cancellation flag with an optional deadline, safe to share between threads.
+
+    A token is cancelled explicitly with cancel() or implicitly once its
+    deadline passes; a child token also follows its parent. Blocking code polls
+    it (raise_if_cancelled, wait) or registers on_cancel callbacks, e.g. to kill
+    a subprocess. Deadlines are checked lazily, so callbacks fire on explicit
+    cancellation only.
+    """
+    def __init__(self, timeout=None, parent=None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        if parent is not None and parent.deadline is not None:
+            self.deadline = parent.deadline if self.deadline is None else min(self.deadline, parent.deadline)
+        self.parent = parent
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def child(self, timeout=None):
+        return CancelToken(timeout, parent=self)
+
+    def cancel(self, reason='cancelled'):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logging.warning(f"Cancel callback failed: {e}")
+
+    def on_cancel(self, callback):
+        """ Call callback() when the token is cancelled (at once if it already is). Returns an unregister function. """
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return unregister
+        callback()
+        return unregister
+
+    @property
+    def cancelled(self):
+        if self._event.is_set():
+            return True
+        if self.parent is not None and self.parent.cancelled:
+            self.reason = self.parent.reason
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reason = 'timeout'
+            return True
+        return False
+
+    def remaining(self):
+        """ Seconds until the deadline, or None without one. """
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            if self.reason == 'timeout':
+                raise TimeoutError("Operation timed out")
+            raise OperationCancelled(self.reason)
+
+    def wait(self, seconds):
+        """ Sleep up to seconds; returns True early if the token is cancelled. """
+        end = time.monotonic() + seconds
+        while not self.cancelled:
+            left = end - time.monotonic()
+            if left <= 0:
+                return False
+            self._event.wait(min(left, CANCEL_POLL_INTERVAL))
+        return True
+
+def call_with_token(token, fn, *args, **kwargs):
+    """ Run fn on a helper thread and wait for it only while token is live.
+
+    Raises TimeoutError or OperationCancelled as soon as the token expires or
+    is cancelled, even if fn is stuck in a blocking call; the helper thread is
+    then left to finish on its own and its result is discarded.
+    """
+    result = {}
+    done = threading.Event()
+
+    def target():
+        try:
+            result['value'] = fn(*args, **kwargs)
+        except BaseException as e:
+            result['error'] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=target, name='cancellable-call', daemon=True).start()
+    while not done.wait(CANCEL_POLL_INTERVAL):
+        token.raise_if_cancelled()
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+# --- Retry Policy ---
+THROTTLE_STATUSES = frozenset({403, 429})
+TRANSIENT_STATUSES = frozenset({408, 500, 502, 503, 504, 520, 522, 524})
+TRANSIENT_MESSAGES = re.compile(r'timed out|connection (?:reset|aborted|refused)|remote end closed|'
+                                r'temporary failure|incomplete ?read|network is unreachable', re.IGNORECASE)
+
+def _error_chain(error):
+    """ error followed by the exceptions it wraps (yt-dlp exc_info/cause, then __cause__/__context__). """
+    chain = []
+    while error is not None and error not in chain and len(chain) < 8:
+        chain.append(error)
+        exc_info = getattr(error, 'exc_info', None)
+        error = (exc_info[1] if exc_info else None) or getattr(error, 'cause', None) or error.__cause__ or error.__context__
+        if not isinstance(error, BaseException):
+            error = None
+    return chain
+
+def parse_retry_after(value):
+    """ Seconds from a Retry-After header (delta-seconds or HTTP date), or None. """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def classify_failure(error):
+    """ Return (kind, retry_after) where kind is 'throttled', 'transient' or 'fatal'. """
+    if isinstance(error, OperationCancelled):
+        return 'fatal', None
+    for cause in _error_chain(error):
+        status = getattr(cause, 'status', None)
+        if isinstance(status, int) and status >= 400:
+            response = getattr(cause, 'response', None)
+            headers = getattr(response, 'headers', None) or {}
+            retry_after = parse_retry_after(headers.get('Retry-After'))
+            if status in THROTTLE_STATUSES or (status == 503 and retry_after is not None):
+                return 'throttled', retry_after
+            return ('transient' if status in TRANSIENT_STATUSES else 'fatal'), retry_after
+        if isinstance(cause, (TimeoutError, ConnectionError)):
+            return 'transient', None
+    match = re.search(r'HTTP Error (\d{3})', str(error))
+    if match:
+        status = int(match.group(1))
+        if status in THROTTLE_STATUSES:
+            return 'throttled', None
+        return ('transient' if status in TRANSIENT_STATUSES else 'fatal'), None
+    if TRANSIENT_MESSAGES.search(str(error)):
+        return 'transient', None
+    return 'fatal', None
+
+def host_key(url):
+    """ Host a URL counts against for circuit breaking, e.g. 'youtube.com'. """
+    host = (urlparse(url if '://' in url else 'https://' + url).hostname or '').lower()
+    for prefix in ('www.', 'm.', 'music.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return 'youtube.com' if host == 'youtu.be' else host
+
+class RetryPolicy:
+    """ Exponential backoff with full jitter, stretched to honour Retry-After. """
+    def __init__(self, attempts=DOWNLOAD_RETRIES, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """ Seconds to wait before retry number attempt (1-based). """
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return min(self.max_delay, max(backoff, retry_after or 0.0))
+
+    def should_retry(self, attempt, kind):
+        return kind != 'fatal' and attempt < self.attempts
+
+class HostCircuitBreaker:
+    """ Per-host throttling detector that holds back new work for a host that is rate limiting us.
+
+    A host trips after BREAKER_THRESHOLD throttled responses within
+    BREAKER_WINDOW; a lone Retry-After just holds it for that long. While open, the
+    scheduler starts no downloads and lookups wait; afterwards it is
+    half-open and admits one download at a time until a success closes it.
+    The open period doubles with each consecutive trip.
+    """
+    def __init__(self, threshold=BREAKER_THRESHOLD, window=BREAKER_WINDOW, cooldown=BREAKER_COOLDOWN,
+                 max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {'events': deque(), 'open_until': 0.0, 'trips': 0}
+        return state
+
+    def record_throttle(self, host, retry_after=None):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(host)
+            state['events'].append(now)
+            while state['events'] and now - state['events'][0] > self.window:
+                state['events'].popleft()
+            if len(state['events']) < self.threshold:
+                # A single Retry-After is honoured as given; only repeated throttling trips the breaker.
+                if retry_after:
+                    state['open_until'] = max(state['open_until'], now + retry_after)
+                return
+            period = min(self.max_cooldown, self.cooldown * 2 ** state['trips'])
+            state['open_until'] = max(state['open_until'], now + max(period, retry_after or 0.0))
+            state['trips'] += 1
+            state['events'].clear()
+            open_for = state['open_until'] - now
+        metrics.inc('y2_breaker_trips_total', host=host)
+        logging.warning(f"Throttling detected from {host}; holding new requests for {open_for:.0f} seconds")
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None and state['open_until'] <= time.monotonic():
+                del self._hosts[host]
+
+    def open_for(self, host):
+        """ Seconds until host accepts requests again (0 if it does now). """
+        with self._lock:
+            state = self._hosts.get(host)
+            return max(0.0, state['open_until'] - time.monotonic()) if state else 0.0
+
+    def half_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return bool(state and state['trips'])
+
+    def admission_delay(self, task, running_tasks):
+        """ Scheduler gate: how long task must still wait before it may start. """
+        host = getattr(task, 'host', None)
+        if not host:
+            return 0.0
+        delay = self.open_for(host)
+        if delay > 0:
+            return delay
+        if self.half_open(host) and any(getattr(t, 'host', None) == host for t in running_tasks):
+            return 1.0
+        return 0.0
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {host: {'open_for': max(0.0, state['open_until'] - now), 'trips': state['trips']}
+                    for host, state in self._hosts.items()}
+
+host_breaker = HostCircuitBreaker()
+SEGMENT_RETRY_POLICY = RetryPolicy(SEGMENT_RETRIES + 1, SEGMENT_RETRY_BASE_DELAY, 10)
+metrics.describe('y2_breaker_trips_total', "Circuit breaker trips by host")
+
+# --- Download Scheduler ---
+class DownloadScheduler:
+    """ Runs queued download tasks on a bounded pool of worker threads.
+
+    Pending tasks are kept in a priority heap (lower value runs first, FIFO within
+    the same priority). Queued tasks can be reprioritized, paused and resumed, and
+    the number of workers can be changed while downloads are running. A task is
+    held back until its not_before time and while the optional gate says so.
+    """
+    def __init__(self, max_workers=DEFAULT_MAX_CONCURRENT_DOWNLOADS):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._entries = {}
+        self._paused = {}
+        self._seq = itertools.count()
+        self._max_workers = max(1, int(max_workers))
+        self._worker_count = 0
+        self._idle_workers = 0
+        self._running = {}
+        self._released = set()
+        self.gate = None  # optional gate(task, running_tasks) -> seconds the task must still wait
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def set_max_workers(self, max_workers):
+        with self._cond:
+            self._max_workers = max(1, int(max_workers))
+            self._spawn_workers()
+            self._cond.notify_all()
+
+    def submit(self, task, priority=0):
+        with self._cond:
+            self._push(task, priority, next(self._seq))
+            self._spawn_workers()
+            self._cond.notify()
+
+    def set_priority(self, task, priority):
+        """ Move a queued task; returns False if it is no longer waiting. """
+        with self._cond:
+            if task.task_id in self._paused:
+                _, seq, paused_task = self._paused[task.task_id]
+                self._paused[task.task_id] = (priority, seq, paused_task)
+                return True
+            entry = self._entries.get(task.task_id)
+            if entry is None:
+                return False
+            entry[-1] = None
+            self._push(task, priority, entry[1])
+            self._cond.notify()
+            return True
+
+    def move_to_front(self, task):
+        with self._cond:
+            priorities = [entry[0] for entry in self._entries.values()]
+        return self.set_priority(task, min(priorities, default=0) - 1)
+
+    def pause(self, task):
+        """ Hold a queued task back without losing its place in the queue. """
+        with self._cond:
+            entry = self._entries.pop(task.task_id, None)
+            if entry is None:
+                return False
+            entry[-1] = None
+            self._paused[task.task_id] = (entry[0], entry[1], task)
+            return True
+
+    def resume(self, task):
+        with self._cond:
+            paused = self._paused.pop(task.task_id, None)
+            if paused is None:
+                return False
+            priority, seq, task = paused
+            self._push(task, priority, seq)
+            self._cond.notify()
+            return True
+
+    def remove(self, task):
+        """ Drop a task that has not started yet; returns False if it is already running. """
+        with self._cond:
+            if self._paused.pop(task.task_id, None) is not None:
+                return True
+            entry = self._entries.pop(task.task_id, None)
+            if entry is None:
+                return False
+            entry[-1] = None
+            return True
+
+    def release(self, task):
+        """ Free the slot of a running task that is winding down after cancellation.
+
+        Its worker may still be blocked (e.g. on a stalled socket); it exits
+        when the task returns, while a new worker picks up queued tasks now.
+        """
+        with self._cond:
+            if task.task_id not in self._running:
+                return False
+            del self._running[task.task_id]
+            self._released.add(task.task_id)
+            self._worker_count -= 1
+            self._spawn_workers()
+            self._cond.notify()
+            return True
+
+    def is_queued(self, task):
+        with self._cond:
+            return task.task_id in self._entries or task.task_id in self._paused
+
+    def counts(self):
+        """ Return (running, queued, paused) task counts. """
+        with self._cond:
+            return len(self._running), len(self._entries), len(self._paused)
+
+    def _push(self, task, priority, seq):
+        entry = [priority, seq, task]
+        self._entries[task.task_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _spawn_workers(self):
+        # Start threads lazily, only while queued tasks outnumber idle workers.
+        while self._worker_count < self._max_workers and self._idle_workers < len(self._entries):
+            self._worker_count += 1
+            self._idle_workers += 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _next_task(self):
+        """ Pop the best task allowed to start; returns (task, wait) with wait until a held-back one may. """
+        held_back = []
+        task = wait = None
+        running = list(self._running.values())
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            candidate = entry[-1]
+            if candidate is None:
+                continue
+            if candidate.task_id in self._running:
+                held_back.append(entry)  # resubmitted for a retry while its last run is still unwinding
+                continue
+            delay = max(0.0, getattr(candidate, 'not_before', 0.0) - time.monotonic())
+            if self.gate is not None:
+                delay = max(delay, self.gate(candidate, running))
+            if delay > 0:
+                held_back.append(entry)
+                wait = delay if wait is None else min(wait, delay)
+                continue
+            del self._entries[candidate.task_id]
+            task = candidate
+            break
+        for entry in held_back:
+            heapq.heappush(self._heap, entry)
+        return task, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                task = None
+                while task is None:
+                    if self._worker_count > self._max_workers:
+                        self._worker_count -= 1
+                        self._idle_workers -= 1
+                        return
+                    task, wait = self._next_task()
+                    if task is None:
+                        self._cond.wait(wait)
+                self._idle_workers -= 1
+                self._running[task.task_id] = task
+            try:
+                task.run()
+            except Exception as e:
+                logging.error(f"Worker crashed running task {task.task_id}: {e}")
+            finally:
+                with self._cond:
+                    if task.task_id in self._released:
+                        # Slot already handed to another worker by release().
+                        self._released.discard(task.task_id)
+                        return
+                    del self._running[task.task_id]
+                    self._idle_workers += 1
+                    self._cond.notify()  # a gated task may be allowed now
+
+download_scheduler = DownloadScheduler()
+download_scheduler.gate = host_breaker.admission_delay
+
+# --- Postprocessing Stage ---
+def transcode_to_mp3(source_path, duration=None, on_progress=None, token=None):
+    """ Convert source_path to an mp3 next to it with ffmpeg and delete the source.
+
+    on_progress(fraction) is called as ffmpeg reports its position (only when
+    duration is known). Cancelling token kills ffmpeg at once; the partial
+    output is removed, the source kept and None returned.
+    """
+    base, ext = os.path.splitext(source_path)
+    target_path = base + '.mp3'
+    if ext.lower() == '.mp3':
+        return source_path
+    ffmpeg = get_ffmpeg_location()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg was not found; it is needed to convert audio to mp3")
+    partial_path = base + '.converting.mp3'
+    command = [ffmpeg, '-y', '-nostdin', '-loglevel', 'error', '-i', source_path, '-vn',
+               '-c:a', 'libmp3lame', '-b:a', MP3_BITRATE, '-f', 'mp3', '-progress', 'pipe:1', '-nostats', partial_path]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0))
+    unregister = token.on_cancel(process.kill) if token is not None else None
+    try:
+        for line in process.stdout:
+            if token is not None and token.cancelled:
+                process.kill()
+                process.wait()
+                return None
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and value.isdigit() and duration and on_progress is not None:
+                on_progress(min(1.0, int(value) / (duration * 1_000_000)))
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            if token is not None and token.cancelled:
+                return None
+            raise RuntimeError(f"ffmpeg exited with status {process.returncode}: {stderr.strip()[-500:]}")
+    finally:
+        if unregister is not None:
+            unregister()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if os.path.exists(partial_path) and process.returncode != 0:
+            os.remove(partial_path)
+    os.replace(partial_path, target_path)
+    os.remove(source_path)
+    return target_path
+
+class TranscodePool:
+    """ Runs CPU-bound conversions for finished downloads, at most one ffmpeg per core.
+
+    Download workers hand a job over and return to the scheduler straight
+    away, so a network slot is never held by a transcode.
+    """
+    def __init__(self, max_workers=TRANSCODE_WORKERS):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self.pending = 0
+
+    def submit(self, job):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='transcode')
+            self.pending += 1
+        self._executor.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            job.run_transcode()
+        except Exception as e:
+            logging.error(f"Transcode worker crashed for task {job.task_id}: {e}")
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+transcode_pool = TranscodePool()
+
+# --- Download Jobs ---
+def is_audio_format(quality_format):
+    return 'audio' in quality_format or quality_format == 'bestaudio/best'
+
+class DownloadJob:
+    """ A single yt-dlp download, run by download_scheduler and reporting through download_queue.
+
+    This holds no UI state; the Tk app subclasses it to add a row in the
+    downloads list and the CLI uses it as is.
+    """
+    segments = DEFAULT_DOWNLOAD_SEGMENTS  # connections per file; 1 disables range splitting
+    timeout = None  # seconds allowed from start to finish, conversion included; None for no limit
+    keep_partial_files = False  # keep .part files of cancelled, timed-out or failed downloads for a later resume
+    retry_policy = RetryPolicy()
+
+    def __init__(self, url, folder, quality_format, is_playlist, info_dict, priority=0, journal_id=None):
+        self.url = url
+        self.folder = folder
+        self.quality_format = quality_format
+        self.is_playlist = is_playlist
+        self.info_dict = info_dict
+        self.cancel_flag = False
+        self.start_time = None
+        self.task_id = id(self)
+        self.filepath = None
+        self.priority = priority
+        self.journal_id = journal_id or uuid.uuid4().hex
+        self.throughput = ThroughputEstimator()
+        self.current_rate = 0.0
+        self.total_bytes = None
+        self.remaining_bytes = None
+        self._governed_bytes = None  # None until the first progress report of the current file
+        self._governed_file = None
+        self.queued_at = None
+        self.timings = {}
+        self.bytes_downloaded = 0
+        self.retries = 0
+        self.retry_log = []
+        self.not_before = 0.0
+        self.host = host_key(url)
+        self.error_class = None
+        self._transfer_started = None
+        self._postprocessor_started = {}
+        self.needs_transcode = is_audio_format(quality_format)
+        self.token = CancelToken()
+        self._terminated = False
+        self._terminate_lock = threading.Lock()
+        self._deadline_timer = None
+        self._partial_paths = set()
+        self.media_duration = None
+        self._transcode_sources = []
+        self.output_suffix = None
+
+    def start_download(self):
+        active_downloads[self.task_id] = self
+        self.queued_at = time.monotonic()
+        job_journal.record(self, 'queued')
+        download_scheduler.submit(self, self.priority)
+
+    def run(self):
+        """ Called by a scheduler worker once a download slot is free. """
+        if self.token.cancelled:
+            self._terminate(self._cancel_outcome())
+            return
+        # A playlist is archived as one entry per folder; only single videos are brought over from elsewhere.
+        source = job_journal.lookup(self.url, self.quality_format, self.folder, elsewhere=not self.is_playlist)
+        if source and self._reuse(source):
+            return
+        if not self.is_playlist:
+            if not output_store.begin(self):
+                # An identical job is downloading; look again once it may have finished.
+                self.not_before = time.monotonic() + DUPLICATE_RECHECK_DELAY
+                download_scheduler.submit(self, self.priority)
+                return
+        self._add_timing('queue_wait', time.monotonic() - self.queued_at)
+        if self.start_time is None:  # a retry keeps the original start time and deadline
+            self.start_time = time.time()
+        if self.timeout and self._deadline_timer is None:
+            self._deadline_timer = threading.Timer(self.timeout, self.cancel, kwargs={'reason': 'timeout'})
+            self._deadline_timer.daemon = True
+            self._deadline_timer.start()
+        job_journal.record(self, 'running')
+        download_queue.put({'task_id': self.task_id, 'status': 'started'})
+        self._download_thread()
+
+    def _skip(self, filepath, linked_from=None):
+        self.filepath = filepath
+        job_journal.record(self, 'skipped')
+        output_store.finish(self)
+        metrics.inc('y2_jobs_total', outcome='linked' if linked_from else 'skipped')
+        download_queue.put({'task_id': self.task_id, 'status': 'skipped', 'filepath': filepath, 'linked_from': linked_from})
+        download_queue.put({'task_id': self.task_id, 'status': 'done'})
+
+    def _reuse(self, source):
+        """ Satisfy the job from an earlier download of the same video and format; False if that fails. """
+        try:
+            filepath, method = output_store.materialize(source, self.folder, OutputStore.tag(self.url), self)
+        except OSError as e:
+            logging.warning(f"Could not reuse {source} for {self.url}: {e}", extra=self._log_extra('download'))
+            output_store.finish(self)
+            return False
+        if method is not None:
+            job_journal.add_to_archive(self.url, self.quality_format, self.folder, filepath)
+            logging.info(f"Reused {source} for {self.url} as {filepath} ({method})", extra=self._log_extra('download'))
+        self._skip(filepath, linked_from=source if method is not None else None)
+        return True
+
+    def _output_hook(self, info, ydl):
+        # Keep this download off any file on disk or being written by another job.
+        suffix = self.output_suffix
+        if suffix is None:
+            path = ydl.prepare_filename(info)
+            expected_size = None if self.needs_transcode else info.get('filesize')
+            if expected_size and output_store.adopt(path, expected_size, self):
+                # Left by a run that finished without archiving it; yt-dlp reports it as
+                # already downloaded and _saved indexes it.
+                suffix = ''
+            else:
+                paths = [path, os.path.splitext(path)[0] + '.mp3'] if self.needs_transcode else [path]
+                suffix = output_store.claim(paths, info.get('id') or OutputStore.tag(self.url), self)
+            if not self.is_playlist:
+                self.output_suffix = suffix  # a retry must resume the same .part file
+        if suffix:
+            info['y2_suffix'] = suffix
+
+    def _progress_hook(self, d):
+        if self.token.cancelled:
+            from yt_dlp.utils import DownloadError
+            raise DownloadError(f"Download {self.token.reason}")
+        if d['status'] == 'downloading':
+            total_size = d.get('total_bytes') or d.get('total_bytes_estimate')
+            downloaded_size = d.get('downloaded_bytes', 0)
+            if d.get('tmpfilename'):
+                self._partial_paths.add(d['tmpfilename'])
+            if self._transfer_started is None:
+                self._transfer_started = time.monotonic()
+            self._throttle(downloaded_size, d.get('tmpfilename'))
+            if total_size and downloaded_size:
+                progress = downloaded_size / total_size
+                downloaded_mb = downloaded_size / (1024 * 1024)
+                total_mb = total_size / (1024 * 1024)
+                elapsed_time = time.time() - self.start_time
+                self.current_rate = self.throughput.update(downloaded_size)
+                self.total_bytes = total_size
+                self.remaining_bytes = max(0, total_size - downloaded_size)
+                download_queue.put({
+                    'task_id': self.task_id, 'status': 'downloading',
+                    'progress': progress, 'downloaded_mb': downloaded_mb,
+                    'total_mb': total_mb, 'elapsed_time': elapsed_time,
+                    'speed': self.current_rate / (1024 * 1024),
+                    'eta': self.throughput.eta(self.remaining_bytes),
+                })
+        elif d['status'] == 'finished':
+            self._governed_bytes = None
+            self.current_rate = 0.0
+            self.remaining_bytes = 0
+            self.bytes_downloaded += d.get('downloaded_bytes') or d.get('total_bytes') or 0
+            if self._transfer_started is not None:
+                self._add_timing('transfer', time.monotonic() - self._transfer_started)
+                self._transfer_started = None
+            self.media_duration = (d.get('info_dict') or {}).get('duration') or self.media_duration
+            if self.needs_transcode:
+                return  # 'finished' is reported once the mp3 exists
+            elapsed_time = time.time() - self.start_time
+            download_queue.put({
+                'task_id': self.task_id, 'status': 'finished',
+                'filepath': d.get('filename'), 'elapsed_time': elapsed_time
+            })
+
+    def _postprocessor_hook(self, d):
+        name = d.get('postprocessor')
+        if d['status'] == 'started':
+            self._postprocessor_started[name] = time.monotonic()
+        elif d['status'] == 'finished' and name in self._postprocessor_started:
+            self._add_timing('postprocess', time.monotonic() - self._postprocessor_started.pop(name))
+
+    def _add_timing(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def _record_metrics(self, outcome):
+        for phase, seconds in self.timings.items():
+            metrics.observe('y2_phase_seconds', seconds, phase=phase)
+        metrics.inc('y2_jobs_total', outcome=outcome)
+        metrics.inc('y2_bytes_total', self.bytes_downloaded)
+        if self.retries:
+            metrics.inc('y2_retries_total', self.retries, phase='download')
+        if self.error_class:
+            metrics.inc('y2_errors_total', phase='download', error_class=self.error_class)
+
+    def _log_extra(self, phase, duration=None):
+        return {'task_id': self.task_id, 'url': self.url, 'phase': phase, 'duration': duration,
+                'timings': self.timings or None, 'retries': self.retry_log or None}
+
+    def _throttle(self, downloaded_size, tmpfilename=None):
+        # yt-dlp calls progress hooks from its read loop, so sleeping here slows the transfer itself.
+        if self._governed_bytes is None or tmpfilename != self._governed_file or downloaded_size < self._governed_bytes:
+            # The first report of a file includes whatever a resumed .part already held;
+            # only bytes that arrive after it are charged.
+            self._governed_bytes = downloaded_size
+            self._governed_file = tmpfilename
+            return
+        delta = downloaded_size - self._governed_bytes
+        self._governed_bytes = downloaded_size
+        wait = bandwidth_governor.reserve(self.task_id, delta)
+        if wait > 0:
+            self.token.wait(wait)
+
+    def _post_hook(self, filepath):
+        # Called with the final path once every postprocessor has run.
+        if self.needs_transcode and not filepath.lower().endswith('.mp3'):
+            self._transcode_sources.append(filepath)
+            return
+        self._saved(filepath)
+
+    def _saved(self, filepath):
+        self.filepath = filepath
+        job_journal.add_to_archive(self.url, self.quality_format, self.folder, filepath)
+        download_queue.put({'task_id': self.task_id, 'status': 'saved', 'filepath': filepath})
+
+    def _cancel_outcome(self):
+        return 'timeout' if self.token.reason == 'timeout' else 'cancelled'
+
+    def _terminate(self, outcome, message=None):
+        """ Record and report how the job ended, once.
+
+        cancel() may report a job while its worker is still unwinding; whatever
+        that worker reports afterwards is ignored.
+        """
+        with self._terminate_lock:
+            if self._terminated:
+                return False
+            self._terminated = True
+        if self._deadline_timer is not None:
+            self._deadline_timer.cancel()
+        output_store.finish(self)
+        if outcome == 'completed':
+            job_journal.record(self, 'completed')
+        elif outcome == 'cancelled':
+            job_journal.record(self, 'cancelled')
+            download_queue.put({'task_id': self.task_id, 'status': 'cancelled'})
+        else:
+            job_journal.record(self, 'failed')
+            if outcome == 'timeout':
+                message = f"Timed out after {self.timeout} seconds."
+            download_queue.put({'task_id': self.task_id, 'status': 'error', 'message': message})
+        self._record_metrics(outcome)
+        if self.task_id in active_downloads:
+            download_queue.put({'task_id': self.task_id, 'status': 'done'})
+        return True
+
+    def _remove_partial_files(self):
+        paths = []
+        for path in self._partial_paths:
+            paths += [path, path + '.ytdl', path + '.segments', path + '.segments.tmp'] + glob.glob(glob.escape(path) + '-Frag*')
+        for path in paths + self._transcode_sources:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not remove partial file {path}: {e}")
+
+    def run_transcode(self):
+        """ Postprocessing stage, run by transcode_pool after the download slot was released. """
+        started = time.monotonic()
+        outcome, message = 'failed', None
+        try:
+            download_queue.put({'task_id': self.task_id, 'status': 'converting', 'progress': 0.0,
+                                'elapsed_time': time.time() - self.start_time})
+
+            def on_progress(fraction):
+                download_queue.put({'task_id': self.task_id, 'status': 'converting', 'progress': fraction,
+                                    'elapsed_time': time.time() - self.start_time})
+
+            for source_path in list(self._transcode_sources):
+                target_path = transcode_to_mp3(source_path, self.media_duration, on_progress, self.token)
+                if target_path is None:
+                    outcome = self._cancel_outcome()
+                    break
+                self._transcode_sources.remove(source_path)
+                download_queue.put({'task_id': self.task_id, 'status': 'finished', 'filepath': target_path,
+                                    'elapsed_time': time.time() - self.start_time})
+                self._saved(target_path)
+            else:
+                outcome = 'completed'
+                logging.info(f"Converted {self.url} to {self.filepath}", extra=self._log_extra('postprocess', time.monotonic() - started))
+            self._add_timing('postprocess', time.monotonic() - started)
+        except Exception as e:
+            self.error_class = classify_error(e)
+            message = f"Conversion failed: {e}"
+            logging.error(f"Conversion failed for {self.url}: {e}", extra=self._log_extra('postprocess'))
+        finally:
+            if outcome in ('cancelled', 'timeout') and not self.keep_partial_files:
+                self._remove_partial_files()
+            self._terminate(outcome, message)
+
+    def _download_thread(self):
+        import yt_dlp
+        outcome, message = 'failed', None
+        handed_off = False
+        self._governed_bytes = None  # a retry starts from what is on disk now
+        try:
+            output_path = os.path.join(self.folder, OUTPUT_TEMPLATE)
+            with ydl_pool.session('download', format=self.quality_format, outtmpl=output_path,
+                                  noplaylist=not self.is_playlist, segments=self.segments,
+                                  progress_hook=self._progress_hook, post_hook=self._post_hook,
+                                  postprocessor_hook=self._postprocessor_hook, output_hook=self._output_hook) as ydl:
+                ydl.download([self.url])
+            if self.token.cancelled:
+                outcome = self._cancel_outcome()
+            else:
+                # The network part succeeded; that alone closes a half-open breaker.
+                host_breaker.record_success(self.host)
+                if self._transcode_sources:
+                    # Free this network slot; the job finishes in the postprocessing stage.
+                    transcode_pool.submit(self)
+                    handed_off = True
+                else:
+                    outcome = 'completed'
+                    logging.info(f"Downloaded {self.url} to {self.filepath}", extra=self._log_extra('download', time.time() - self.start_time))
+        except Exception as e:
+            if self.token.cancelled:
+                outcome = self._cancel_outcome()
+            else:
+                self.error_class = classify_error(e)
+                kind, retry_after = classify_failure(e)
+                if kind == 'throttled':
+                    host_breaker.record_throttle(self.host, retry_after)
+                if self.retry_policy.should_retry(self.retries + 1, kind):
+                    outcome = 'retrying'
+                    self._schedule_retry(kind, retry_after, e)
+                elif isinstance(e, yt_dlp.utils.DownloadError):
+                    message = f"Download failed: {e}"
+                    logging.error(f"DownloadError for {self.url}: {e}", extra=self._log_extra('download'))
+                else:
+                    message = f"An error occurred: {e}"
+                    logging.error(f"Unhandled exception for {self.url}: {e}", extra=self._log_extra('download'))
+        finally:
+            bandwidth_governor.release(self.task_id)
+            if not handed_off and outcome in ('cancelled', 'timeout', 'failed') and not self.keep_partial_files:
+                self._remove_partial_files()
+            if outcome == 'retrying':
+                if self.token.cancelled:
+                    download_scheduler.remove(self)
+                    if not self.keep_partial_files:
+                        self._remove_partial_files()
+                    self._terminate(self._cancel_outcome())
+            elif not handed_off:
+                self._terminate(outcome, message)
+
+    def _schedule_retry(self, kind, retry_after, error):
+        """ Put the job back in the queue to run again after a backoff delay.
+
+        The .part file (and, for a segmented download, its .segments
+        progress) is kept so the next attempt resumes it; it is removed if the
+        job is cancelled or times out meanwhile, unless keep_partial_files is
+        set. The scheduler also holds the job back while host_breaker is open
+        for its host.
+        """
+        self.retries += 1
+        delay = self.retry_policy.delay(self.retries, retry_after)
+        self.not_before = time.monotonic() + delay
+        self.retry_log.append({'attempt': self.retries, 'kind': kind, 'error_class': self.error_class, 'delay': round(delay, 2)})
+        logging.warning(f"Retrying {self.url} in {delay:.1f} seconds ({kind}: {error})", extra=self._log_extra('download'))
+        self.queued_at = time.monotonic()
+        job_journal.record(self, 'queued')
+        download_queue.put({'task_id': self.task_id, 'status': 'retrying', 'attempt': self.retries,
+                            'max_attempts': self.retry_policy.attempts, 'delay': delay,
+                            'reason': self.error_class or kind})
+        download_scheduler.submit(self, self.priority)
+
+    def cancel(self, reason='cancelled'):
+        """ Stop the job; returns True if it has already been reported as ended.
+
+        A queued job is dropped. A running download gives its scheduler slot to
+        the next job at once and is reported now, even if its worker is stuck
+        in a read until socket_timeout; the worker cleans up as it unwinds. A
+        conversion has its ffmpeg killed and reports from the transcode pool.
+        """
+        self.cancel_flag = True
+        self.token.cancel(reason)
+        if download_scheduler.remove(self):
+            if not self.keep_partial_files:
+                self._remove_partial_files()  # left by an attempt that is waiting to be retried
+            self._terminate(self._cancel_outcome())
+            return True
+        if download_scheduler.release(self):
+            self._terminate(self._cancel_outcome())
+            return True
+        return False
+
+def fetch_video_details(url, is_playlist=False, refresh=False, retries=DETAILS_RETRIES, retry_delay=DETAILS_RETRY_DELAY, token=None):
+    """ Extract info for url with retries. Returns (info_dict, error_message).
+
+    Each attempt gets DETAILS_TIMEOUT seconds; cancelling token abandons the
+    lookup immediately. Timeouts, throttling and server errors are retried
+    with jittered backoff; anything else (e.g. a private video) fails at once.
+    """
+    import yt_dlp
+    token = token or CancelToken()
+    policy = RetryPolicy(retries, retry_delay)
+    host = host_key(url)
+    info_dict = None
+    error_message = None
+    started = time.monotonic()
+
+    def stopped_message():
+        return "Operation timed out while loading video details." if token.reason == 'timeout' else "Loading was cancelled."
+
+    delay = 0.0
+    for attempt in range(1, retries + 1):
+        delay = max(delay, host_breaker.open_for(host))
+        if delay > DETAILS_TIMEOUT:
+            error_message = f"{host} is limiting requests; try again in {delay:.0f} seconds."
+            break
+        if delay and token.wait(delay):
+            error_message = stopped_message()
+            break
+        if attempt > 1:
+            metrics.inc('y2_retries_total', phase='extract')
+        retry_after = None
+        try:
+            info_dict = extract_info_cached(url, 'details_flat' if is_playlist else 'details', refresh=refresh,
+                                            token=token.child(DETAILS_TIMEOUT))
+            error_message = None
+            host_breaker.record_success(host)
+            break
+        except OperationCancelled:
+            error_message = stopped_message()
+            break
+        except TimeoutError as e:
+            if token.cancelled:
+                error_message = stopped_message()
+                break
+            metrics.inc('y2_errors_total', phase='extract', error_class=classify_error(e))
+            logging.warning(f"Timeout on attempt {attempt} for {url}")
+            error_message = "Operation timed out while loading video details."
+        except yt_dlp.utils.DownloadError as e:
+            metrics.inc('y2_errors_total', phase='extract', error_class=classify_error(e))
+            error_message = f"Could not load video details: {e}"
+            logging.error(f"yt-dlp error loading details for {url}: {e}")
+            kind, retry_after = classify_failure(e)
+            if kind == 'throttled':
+                host_breaker.record_throttle(host, retry_after)
+            elif kind == 'fatal':
+                break
+        except Exception as e:
+            metrics.inc('y2_errors_total', phase='extract', error_class=classify_error(e))
+            error_message = f"An unexpected error occurred: {e}"
+            logging.error(f"Unhandled exception loading details for {url}: {e}")
+            break
+        delay = policy.delay(attempt, retry_after)
+    else:
+        logging.error(f"All {retries} attempts failed for {url}")
+    metrics.observe('y2_phase_seconds', time.monotonic() - started, phase='extract')
+    return info_dict, error_message
+
+# --- Batch Metadata Prefetch ---
+URL_PATTERN = re.compile(r'(?:https?://|www\.|youtu\.be/|youtube\.com/)\S+', re.IGNORECASE)
+
+def parse_url_list(text):
+    """ URLs found in pasted or imported text, in order, without duplicates of the same video. """
+    urls = []
+    seen = set()
+    for match in URL_PATTERN.finditer(text):
+        url = match.group(0).rstrip('.,;)>"\'')
+        key = canonical_media_key(url) or url
+        if key not in seen:
+            seen.add(key)
+            urls.append(url)
+    return urls
+
+class MetadataPrefetcher:
+    """ Loads details for many URLs concurrently on a bounded pool.
+
+    Results are handed to the callback one by one as they arrive, from a
+    pool thread. Lookups go through extract_info_cached, so cached items
+    return at once and duplicates in flight are extracted only once.
+    """
+    def __init__(self, max_workers=PREFETCH_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, urls, callback, is_playlist=False, token=None):
+        """ Queue every url; callback(url, info_dict, error_message) runs once per url. Returns the batch token. """
+        token = token or CancelToken()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='prefetch')
+        for url in urls:
+            self._executor.submit(self._load, url, is_playlist, token, callback)
+        return token
+
+    def _load(self, url, is_playlist, token, callback):
+        if token.cancelled:
+            callback(url, None, "Loading was cancelled.")
+            return
+        try:
+            info_dict, error_message = fetch_video_details(url, is_playlist, token=token)
+        except Exception as e:
+            info_dict, error_message = None, f"An unexpected error occurred: {e}"
+        callback(url, info_dict, error_message)
+
+metadata_prefetcher = MetadataPrefetcher()